@@ -0,0 +1,335 @@
+import argparse
+import itertools
+import json
+import platform
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections.abc import Callable
+from functools import partial
+
+import jax
+import numpy as np
+from flax import nnx
+from gpjax import kernels as jaxkernels
+from sklearn.gaussian_process import kernels
+
+import jaxsensor
+import pysensor as sensor
+from pysensor.kernels import Wendland, support
+
+try:
+    import cysensor
+
+    cython = True
+except ImportError:
+    cython = False
+
+# enable int64/float64
+jax.config.update("jax_enable_x64", True)
+
+# sklearn and gpjax kernels with unit length scale, a compact kernel without
+# a gpjax counterpart has a short radius so its factors are sparse
+KERNELS = {
+    "matern12": (
+        lambda: kernels.Matern(length_scale=1, nu=1 / 2),
+        lambda: jaxkernels.Matern12(lengthscale=1),
+    ),
+    "matern32": (
+        lambda: kernels.Matern(length_scale=1, nu=3 / 2),
+        lambda: jaxkernels.Matern32(lengthscale=1),
+    ),
+    "matern52": (
+        lambda: kernels.Matern(length_scale=1, nu=5 / 2),
+        lambda: jaxkernels.Matern52(lengthscale=1),
+    ),
+    "rbf": (
+        lambda: kernels.RBF(length_scale=1),
+        lambda: jaxkernels.RBF(lengthscale=1),
+    ),
+    "rq": (
+        lambda: kernels.RationalQuadratic(length_scale=1, alpha=1),
+        lambda: jaxkernels.RationalQuadratic(lengthscale=1, alpha=1),
+    ),
+    "wendland": (lambda: Wendland(length_scale=0.1), lambda: None),
+}
+
+# memory changes below this many MiB are noise
+MEMORY_SLACK = 1.0
+
+Method = Callable[[np.ndarray, kernels.Kernel, tuple, int], object]
+
+
+def python_method(f) -> Method:
+    """Wrap a method taking an sklearn kernel."""
+    return lambda X, kernel, _, s: f(X, kernel, s)
+
+
+def jax_method(f) -> Method:
+    """Wrap a JAX method taking a split kernel to wait for the result."""
+    return lambda X, _, kernel, s: f(X, kernel, s).block_until_ready()
+
+
+def checkpoint_method(f) -> Method:
+    """Wrap a method to checkpoint every 10 selections to a temp dir."""
+
+    def method(X, kernel, _, s):
+        with tempfile.TemporaryDirectory() as root:
+            checkpoint = sensor.Checkpoint(root, every=10)
+            return f(X, kernel, s, checkpoint=checkpoint)
+
+    return method
+
+
+# benchmarked methods for each objective
+METHODS: dict[str, dict[str, Method]] = {
+    "entropy": {
+        "naive": python_method(sensor.entropy_naive),
+        "python prec": python_method(sensor.entropy_prec),
+        "python prechol": python_method(sensor.entropy_prechol),
+        "python chol": python_method(sensor.entropy_chol),
+        "python batch": python_method(sensor.entropy_batch),
+        "python stream": python_method(sensor.entropy_stream),
+        "python float32": python_method(
+            partial(sensor.entropy_chol, dtype=np.float32)
+        ),
+        "python sparse": python_method(sensor.entropy_sparse),
+        "python checkpoint": checkpoint_method(sensor.entropy_chol),
+        "jax": jax_method(jaxsensor.entropy),
+        "jax bucketed": jax_method(jaxsensor.entropy_bucketed),
+    },
+    "mi": {
+        "naive": python_method(sensor.mi_naive),
+        "python prec": python_method(sensor.mi_prec),
+        "python chol": python_method(sensor.mi_chol),
+        "python lazy": python_method(sensor.mi_lazy),
+        "python lowrank": python_method(sensor.mi_lowrank),
+        "python sparse": python_method(sensor.mi_sparse),
+        "python checkpoint": checkpoint_method(sensor.mi_chol),
+        "jax": jax_method(jaxsensor.mi),
+        "jax chol": jax_method(jaxsensor.mi_chol),
+        "jax bucketed": jax_method(jaxsensor.mi_bucketed),
+    },
+}
+if cython:
+    METHODS["entropy"]["cython chol"] = python_method(
+        cysensor.entropy_chol  # pyright: ignore
+    )
+    METHODS["entropy"]["cython batch"] = python_method(
+        cysensor.entropy_batch  # pyright: ignore
+    )
+    METHODS["mi"]["cython chol"] = python_method(
+        cysensor.mi_chol  # pyright: ignore
+    )
+
+
+def reset_peak_rss() -> None:
+    """Reset the peak resident set size of this process if possible."""
+    # writing 5 to clear_refs resets VmHWM on Linux
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def peak_rss() -> float:
+    """Peak resident set size in MiB since the last reset."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 2**10
+    except OSError:
+        pass
+    # ru_maxrss is in KiB on Linux and never decreases
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2**10
+
+
+def measure(f: Callable[[], None], repeat: int, warmup: int) -> dict:
+    """Time f over repeated runs and measure its memory use."""
+    for _ in range(warmup):
+        f()
+    reset_peak_rss()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        f()
+        times.append(time.perf_counter() - start)
+    rss = peak_rss()
+    # tracing slows down allocation so it gets its own run
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    f()
+    after = tracemalloc.take_snapshot()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    q1, median, q3 = np.percentile(times, [25, 50, 75])
+    return {
+        "times": times,
+        "median": median,
+        "iqr": q3 - q1,
+        "peak_rss": rss,
+        "alloc_peak": peak / 2**20,
+        # blocks the run left allocated, not the number of allocations,
+        # which tracemalloc can't count without hooking the allocator
+        "live_blocks": sum(
+            stat.count_diff for stat in after.compare_to(before, "filename")
+        ),
+    }
+
+
+def key(result: dict) -> tuple:
+    """Identify a configuration across runs."""
+    names = ["objective", "method", "kernel", "n", "s", "d"]
+    return tuple(result[name] for name in names)
+
+
+def regressions(
+    result: dict, baseline: dict[tuple, dict], tolerance: float
+) -> list[str]:
+    """Metrics of result worse than the baseline beyond tolerance."""
+    base = baseline.get(key(result))
+    if base is None:
+        return []
+    flagged = []
+    # time has to be slower by more than the noise of either run
+    slower = result["median"] - base["median"]
+    if slower > tolerance * base["median"] and slower > max(
+        result["iqr"], base["iqr"]
+    ):
+        flagged.append(f"time x{result['median'] / base['median']:.2f}")
+    for metric in ["peak_rss", "alloc_peak"]:
+        # ignore changes in memory smaller than the slack
+        grew = result[metric] - base[metric]
+        if grew > tolerance * base[metric] and grew > MEMORY_SLACK:
+            ratio = result[metric] / max(base[metric], MEMORY_SLACK)
+            flagged.append(f"{metric} x{ratio:.2f}")
+    return flagged
+
+
+def parse_args() -> argparse.Namespace:
+    """Parse the benchmark grid and output options."""
+    parser = argparse.ArgumentParser(
+        description="Benchmark sensor placement over a grid of problems."
+    )
+    parser.add_argument("--n", type=int, nargs="+", default=[1000, 4000])
+    parser.add_argument("--s", type=int, nargs="+", default=[50, 100])
+    parser.add_argument("--d", type=int, nargs="+", default=[3])
+    parser.add_argument(
+        "--kernel", nargs="+", choices=KERNELS, default=["matern52"]
+    )
+    parser.add_argument(
+        "--objective", nargs="+", choices=METHODS, default=list(METHODS)
+    )
+    parser.add_argument(
+        "--method",
+        nargs="+",
+        help="methods to run, all available methods by default",
+    )
+    parser.add_argument(
+        "--naive-max",
+        type=int,
+        default=1000,
+        help="largest n the naive methods are run on",
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write results as JSON")
+    parser.add_argument("--baseline", help="JSON results to compare against")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.2,
+        help="relative slowdown flagged as a regression",
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+
+    baseline = {}
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = {
+                key(result): result for result in json.load(f)["results"]
+            }
+
+    results, flagged = [], 0
+    grid = itertools.product(
+        args.objective, args.kernel, args.d, args.n, args.s
+    )
+    for objective, kernel_name, d, n, s in grid:
+        if s > n:
+            continue
+        rng = np.random.default_rng(args.seed)
+        X = rng.random((n, d))
+        kernel, jaxkernel = (f() for f in KERNELS[kernel_name])
+        if jaxkernel is not None:
+            jaxkernel = nnx.split(jaxkernel)
+        for method, f in METHODS[objective].items():
+            if args.method is not None and method not in args.method:
+                continue
+            if method.startswith("jax") and jaxkernel is None:
+                continue
+            config = {
+                "objective": objective,
+                "method": method,
+                "kernel": kernel_name,
+                "n": n,
+                "s": s,
+                "d": d,
+            }
+            label = (
+                f"{objective:>7} {method:<17} {kernel_name:<8}"
+                f" n={n:<6} s={s:<4} d={d}:"
+            )
+            # the naive methods are the slowest by orders of magnitude
+            if method == "naive" and n > args.naive_max:
+                print(f"{label} skipped (n > --naive-max {args.naive_max})")
+                continue
+            # sparse factors of a kernel without compact support are dense
+            if method.endswith("sparse") and support(kernel) == np.inf:
+                continue
+            try:
+                result = config | measure(
+                    partial(f, X, kernel, jaxkernel, s),
+                    args.repeat,
+                    args.warmup,
+                )
+            except (np.linalg.LinAlgError, ValueError) as error:
+                # ill-conditioned kernels break methods that factor the gram
+                print(f"{label} failed ({error})")
+                continue
+            results.append(result)
+            worse = regressions(result, baseline, args.tolerance)
+            flagged += len(worse) > 0
+            print(
+                f"{label} {result['median']:9.3e} ± {result['iqr']:9.3e} s"
+                f" rss {result['peak_rss']:8.1f} MiB"
+                f" alloc {result['alloc_peak']:8.1f} MiB"
+                f" ({result['live_blocks']} blocks live)"
+                + "".join(f" REGRESSION {w}" for w in worse)
+            )
+
+    if args.output is not None:
+        meta = {
+            "python": sys.version,
+            "platform": platform.platform(),
+            "numpy": np.__version__,
+            "jax": jax.__version__,
+            "cython": cython,
+            "repeat": args.repeat,
+            "warmup": args.warmup,
+            "seed": args.seed,
+        }
+        with open(args.output, "w") as f:
+            json.dump({"meta": meta, "results": results}, f, indent=2)
+
+    if flagged > 0:
+        print(f"{flagged} regressions against {args.baseline}")
+        sys.exit(1)
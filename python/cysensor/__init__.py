@@ -1,3 +1,3 @@
-from .cysensor import entropy_chol
+from .cysensor import entropy_batch, entropy_chol, mi_chol
 
-__all__ = ["entropy_chol"]
+__all__ = ["entropy_batch", "entropy_chol", "mi_chol"]
@@ -3,7 +3,7 @@ cdef struct Kernel:
     void (*kernel_function)(void *params, double[:, ::1] points,
                             double[::1] point, double *vector)
     void (*diag)(void *params, double[:, ::1] points, double *vector)
-    bint cleanup
+    void (*cleanup)(void *params)
 
 cdef (Kernel *) get_kernel(kernel)
 
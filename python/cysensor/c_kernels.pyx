@@ -1,7 +1,7 @@
-# cython: profile=False
 from cpython.mem cimport PyMem_Free, PyMem_Malloc
 from cpython.ref cimport PyObject
-from libc.math cimport exp, sqrt
+from cython.parallel cimport prange
+from libc.math cimport pow, sqrt
 
 import numpy as np
 import sklearn.gaussian_process.kernels as kernels
@@ -20,18 +20,49 @@ cdef (Kernel *) get_kernel(kernel_object: kernels.Kernel):
     kernel.kernel_function = &__python_covariance
     kernel.diag = &__python_variance
     # don't free a Python object (not malloc'd)
-    kernel.cleanup = False
+    kernel.cleanup = NULL
 
     # specialize to optimized C if possible
-    if (
+    if isinstance(kernel_object, (kernels.Sum, kernels.Product)):
+        kernel.params = __operator_params(kernel_object)
+        if isinstance(kernel_object, kernels.Sum):
+            kernel.kernel_function = &__sum_covariance
+            kernel.diag = &__sum_variance
+        else:
+            kernel.kernel_function = &__product_covariance
+            kernel.diag = &__product_variance
+        kernel.cleanup = &__operator_cleanup
+    elif isinstance(kernel_object, kernels.ConstantKernel):
+        kernel.params = __scalar_params(kernel_object.constant_value)
+        kernel.kernel_function = &__constant_covariance
+        kernel.diag = &__constant_variance
+        kernel.cleanup = &PyMem_Free
+    elif isinstance(kernel_object, kernels.WhiteKernel):
+        kernel.params = __scalar_params(kernel_object.noise_level)
+        kernel.kernel_function = &__white_covariance
+        kernel.diag = &__constant_variance
+        kernel.cleanup = &PyMem_Free
+    elif (
         isinstance(kernel_object, kernels.Matern)
-        and not isinstance(kernel_object.length_scale, list)
-        and not isinstance(kernel_object.length_scale, np.ndarray)
+        and kernel_object.nu in (0.5, 1.5, 2.5)
     ):
-        kernel.params = __matern_params(kernel_object)
+        kernel.params = __stationary_params(kernel_object)
         kernel.kernel_function = &__matern_covariance
-        kernel.diag = &__matern_variance
-        kernel.cleanup = True
+        kernel.diag = &__stationary_variance
+        kernel.cleanup = &__stationary_cleanup
+    elif (
+        isinstance(kernel_object, kernels.Matern)
+        and kernel_object.nu == np.inf
+    ) or type(kernel_object) is kernels.RBF:
+        kernel.params = __stationary_params(kernel_object)
+        kernel.kernel_function = &__rbf_covariance
+        kernel.diag = &__stationary_variance
+        kernel.cleanup = &__stationary_cleanup
+    elif isinstance(kernel_object, kernels.RationalQuadratic):
+        kernel.params = __stationary_params(kernel_object)
+        kernel.kernel_function = &__rq_covariance
+        kernel.diag = &__stationary_variance
+        kernel.cleanup = &__stationary_cleanup
 
     return kernel
 
@@ -57,8 +88,8 @@ cdef void variance_vector(
 
 cdef void kernel_cleanup(Kernel *kernel):
     """Free dynamically allocated memory."""
-    if kernel.cleanup:
-        PyMem_Free(kernel.params)
+    if kernel.cleanup != NULL:
+        kernel.cleanup(kernel.params)
     PyMem_Free(kernel)
 
 
@@ -100,50 +131,274 @@ cdef void __python_variance(
         vector[i] = var[i]
 
 
-### matern covariance
+cdef double *__workspace(double **work, int *size, int n):
+    """Grow a workspace reused between calls to hold n values."""
+    if size[0] < n:
+        PyMem_Free(work[0])
+        work[0] = <double *> PyMem_Malloc(n * sizeof(double))
+        size[0] = n
+    return work[0]
+
+
+### sum and product of kernels
+
+
+cdef struct OperatorParams:
+    Kernel *k1
+    Kernel *k2
+    # workspace reused between calls
+    double *work
+    int size
+
+
+cdef (void *) __operator_params(kernel: kernels.Kernel):
+    """Intialize an OperatorParams struct based on the given kernel."""
+    cdef OperatorParams *params_ptr
+    params_ptr = <OperatorParams *> PyMem_Malloc(sizeof(OperatorParams))
+    params_ptr.k1 = get_kernel(kernel.k1)
+    params_ptr.k2 = get_kernel(kernel.k2)
+    params_ptr.work = NULL
+    params_ptr.size = 0
+    return <void *>params_ptr
+
+
+cdef void __operator_cleanup(void *params):
+    """Free an OperatorParams struct, its kernels and its workspace."""
+    cdef OperatorParams *operator_params = <OperatorParams *> params
+    kernel_cleanup(operator_params.k1)
+    kernel_cleanup(operator_params.k2)
+    PyMem_Free(operator_params.work)
+    PyMem_Free(params)
+
+
+cdef void __sum_covariance(
+    void *params,
+    double[:, ::1] points,
+    double[::1] point,
+    double *vector,
+):
+    """ Sum of the covariances of two kernels. """
+    cdef:
+        OperatorParams *operator_params
+        int n, i
+        double *u
+
+    operator_params = <OperatorParams *> params
+    n = points.shape[0]
+    u = __workspace(&operator_params.work, &operator_params.size, n)
+    covariance_vector(operator_params.k1, points, point, vector)
+    covariance_vector(operator_params.k2, points, point, u)
+    for i in prange(n, nogil=True, schedule="static"):
+        vector[i] += u[i]
+
+
+cdef void __sum_variance(
+    void *params,
+    double[:, ::1] points,
+    double *vector,
+):
+    """ Sum of the variances of two kernels. """
+    cdef:
+        OperatorParams *operator_params
+        int n, i
+        double *u
+
+    operator_params = <OperatorParams *> params
+    n = points.shape[0]
+    u = __workspace(&operator_params.work, &operator_params.size, n)
+    variance_vector(operator_params.k1, points, vector)
+    variance_vector(operator_params.k2, points, u)
+    for i in prange(n, nogil=True, schedule="static"):
+        vector[i] += u[i]
+
+
+cdef void __product_covariance(
+    void *params,
+    double[:, ::1] points,
+    double[::1] point,
+    double *vector,
+):
+    """ Product of the covariances of two kernels. """
+    cdef:
+        OperatorParams *operator_params
+        int n, i
+        double *u
+
+    operator_params = <OperatorParams *> params
+    n = points.shape[0]
+    u = __workspace(&operator_params.work, &operator_params.size, n)
+    covariance_vector(operator_params.k1, points, point, vector)
+    covariance_vector(operator_params.k2, points, point, u)
+    for i in prange(n, nogil=True, schedule="static"):
+        vector[i] *= u[i]
+
+
+cdef void __product_variance(
+    void *params,
+    double[:, ::1] points,
+    double *vector,
+):
+    """ Product of the variances of two kernels. """
+    cdef:
+        OperatorParams *operator_params
+        int n, i
+        double *u
+
+    operator_params = <OperatorParams *> params
+    n = points.shape[0]
+    u = __workspace(&operator_params.work, &operator_params.size, n)
+    variance_vector(operator_params.k1, points, vector)
+    variance_vector(operator_params.k2, points, u)
+    for i in prange(n, nogil=True, schedule="static"):
+        vector[i] *= u[i]
+
+
+### constant and white noise kernels
+
+
+cdef (void *) __scalar_params(double value):
+    """Store a single kernel parameter."""
+    cdef double *params_ptr
+    params_ptr = <double *> PyMem_Malloc(sizeof(double))
+    params_ptr[0] = value
+    return <void *>params_ptr
+
+
+cdef void __constant_covariance(
+    void *params,
+    double[:, ::1] points,
+    double[::1] point,
+    double *vector,
+):
+    """ Constant covariance between each point in points and given point. """
+    cdef:
+        int i
+        double value
+
+    value = (<double *> params)[0]
+    for i in range(points.shape[0]):
+        vector[i] = value
+
+
+cdef void __constant_variance(
+    void *params,
+    double[:, ::1] points,
+    double *vector,
+):
+    """ Constant variance for each point in points. """
+    cdef:
+        int i
+        double value
+
+    value = (<double *> params)[0]
+    for i in range(points.shape[0]):
+        vector[i] = value
+
+
+cdef void __white_covariance(
+    void *params,
+    double[:, ::1] points,
+    double[::1] point,
+    double *vector,
+):
+    """ White noise covariance between each point in points and point. """
+    cdef int i
+    # scikit-learn treats the given point as distinct from points
+    for i in range(points.shape[0]):
+        vector[i] = 0
+
+
+### stationary kernels
 
 cdef double SQRT3 = sqrt(3)
 cdef double SQRT5 = sqrt(5)
 
 
-cdef struct MaternParams:
+cdef struct StationaryParams:
+    # one length scale per dimension or a single isotropic length scale
+    double *length_scale
+    int dims
+    # Matern smoothness and rational quadratic scale mixture
     double nu
-    double length_scale
+    double alpha
+    # workspace reused between calls
+    double *work
+    int size
 
 
-cdef (void *) __matern_params(kernel: kernels.Kernel):
-    """Intialize a MaternParams struct based on the given kernel."""
-    cdef MaternParams *params_ptr
-    params_ptr = <MaternParams *> PyMem_Malloc(sizeof(MaternParams))
+cdef (void *) __stationary_params(kernel: kernels.Kernel):
+    """Intialize a StationaryParams struct based on the given kernel."""
+    cdef:
+        StationaryParams *params_ptr
+        int i
+
+    params_ptr = <StationaryParams *> PyMem_Malloc(sizeof(StationaryParams))
     params = kernel.get_params()
-    params_ptr.nu = params["nu"]
-    params_ptr.length_scale = params["length_scale"]
+    length_scale = np.atleast_1d(params["length_scale"]).astype(np.float64)
+    params_ptr.dims = length_scale.shape[0]
+    params_ptr.length_scale = <double *> PyMem_Malloc(
+        params_ptr.dims * sizeof(double)
+    )
+    for i in range(params_ptr.dims):
+        params_ptr.length_scale[i] = length_scale[i]
+    params_ptr.nu = params.get("nu", 0)
+    params_ptr.alpha = params.get("alpha", 0)
+    params_ptr.work = NULL
+    params_ptr.size = 0
     return <void *>params_ptr
 
 
-cdef void __distance_vector(
+cdef void __stationary_cleanup(void *params):
+    """Free a StationaryParams struct and its workspace."""
+    PyMem_Free((<StationaryParams *> params).length_scale)
+    PyMem_Free((<StationaryParams *> params).work)
+    PyMem_Free(params)
+
+
+cdef void __sq_distance_vector(
     double[:, ::1] points,
     double[::1] point,
+    StationaryParams *params,
     double *vector,
 ):
-    """ Euclidean distance between each point in points and given point. """
+    """ Squared scaled distance between each point in points and point. """
     cdef:
         int n, i, j
         double dist, d
         double *start
         double *p
+        double *scale
 
     n = points.shape[1]
     start = &points[0, 0]
     p = &point[0]
-    for i in range(points.shape[0]):
-        dist = 0
-        for j in range(n):
-            d = (start + i*n)[j] - p[j]
-            dist += d*d
-        vector[i] = dist
+    scale = params.length_scale
+    if params.dims == 1:
+        for i in prange(points.shape[0], nogil=True, schedule="static"):
+            dist = 0
+            for j in range(n):
+                d = ((start + i*n)[j] - p[j])/scale[0]
+                dist = dist + d*d
+            vector[i] = dist
+    else:
+        for i in prange(points.shape[0], nogil=True, schedule="static"):
+            dist = 0
+            for j in range(n):
+                d = ((start + i*n)[j] - p[j])/scale[j]
+                dist = dist + d*d
+            vector[i] = dist
+
 
-    mkl.vdSqrt(points.shape[0], vector, vector)
+cdef void __stationary_variance(
+    void *params,
+    double[:, ::1] points,
+    double *vector,
+):
+    """ Stationary variance for each point in points. """
+    cdef int i
+    for i in range(points.shape[0]):
+        # stationary kernels have covariance one between a point and itself
+        vector[i] = 1
 
 
 cdef void __matern_covariance(
@@ -154,52 +409,74 @@ cdef void __matern_covariance(
 ):
     """ Matern covariance between each point in points and given point. """
     cdef:
-        MaternParams *matern_params
+        StationaryParams *matern_params
         int n, incx, i
-        double nu, length_scale, alpha, x
+        double nu, alpha, x
         double *u
 
-    matern_params = <MaternParams *> params
+    matern_params = <StationaryParams *> params
     nu = matern_params.nu
-    length_scale = matern_params.length_scale
-
-    __distance_vector(points, point, vector)
 
     n = points.shape[0]
+    __sq_distance_vector(points, point, matern_params, vector)
+    mkl.vdSqrt(n, vector, vector)
+
     if nu == 0.5:
-        alpha = 1
+        alpha = -1
     elif nu == 1.5:
-        alpha = SQRT3
+        alpha = -SQRT3
     else:
-        alpha = SQRT5
-    alpha /= -length_scale
+        alpha = -SQRT5
     incx = 1
     blas.dscal(&n, &alpha, vector, &incx)
-    u = <double *> PyMem_Malloc(n * sizeof(double))
+    u = __workspace(&matern_params.work, &matern_params.size, n)
     mkl.vdExp(n, vector, u)
 
     if nu == 0.5:
-        for i in range(n):
+        for i in prange(n, nogil=True, schedule="static"):
             vector[i] = u[i]
     elif nu == 1.5:
-        for i in range(n):
+        for i in prange(n, nogil=True, schedule="static"):
             x = vector[i]
             vector[i] = (1 - x)*u[i]
     else:
-        for i in range(n):
+        for i in prange(n, nogil=True, schedule="static"):
             x = vector[i]
             vector[i] = (1 - x + x*x/3)*u[i]
 
-    PyMem_Free(u)
+
+cdef void __rbf_covariance(
+    void *params,
+    double[:, ::1] points,
+    double[::1] point,
+    double *vector,
+):
+    """ Squared exponential covariance between points and given point. """
+    cdef:
+        int n, incx
+        double alpha
+
+    n = points.shape[0]
+    __sq_distance_vector(points, point, <StationaryParams *> params, vector)
+    alpha = -0.5
+    incx = 1
+    blas.dscal(&n, &alpha, vector, &incx)
+    mkl.vdExp(n, vector, vector)
 
 
-cdef void __matern_variance(
+cdef void __rq_covariance(
     void *params,
     double[:, ::1] points,
+    double[::1] point,
     double *vector,
 ):
-    """ Matern variance for each point in points. """
-    cdef int i
-    for i in range(points.shape[0]):
-        # Matern kernels have covariance one between a point and itself
-        vector[i] = 1
+    """ Rational quadratic covariance between points and given point. """
+    cdef:
+        int n, i
+        double alpha
+
+    n = points.shape[0]
+    __sq_distance_vector(points, point, <StationaryParams *> params, vector)
+    alpha = (<StationaryParams *> params).alpha
+    for i in prange(n, nogil=True, schedule="static"):
+        vector[i] = pow(1 + vector[i]/(2*alpha), -alpha)
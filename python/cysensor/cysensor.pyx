@@ -1,6 +1,11 @@
-# cython: profile=False
+from posix.time cimport CLOCK_MONOTONIC, clock_gettime, timespec
+
 cimport numpy as np
+from cython.parallel cimport prange
 from libc.math cimport sqrt
+from openmp cimport omp_get_max_threads, omp_set_num_threads
+
+import sys
 
 import numpy as np
 
@@ -31,6 +36,21 @@ cdef int __argmax(double[::1] x):
     return k
 
 
+cdef object __clock(str method, int n, int d):
+    """Clock of pysensor.profiling if it's loaded, otherwise None."""
+    # a profiler can only be active once pysensor has been imported, so
+    # the compiled module never imports it
+    profiling = sys.modules.get("pysensor.profiling")
+    return None if profiling is None else profiling.clock(method, n, d)
+
+
+cdef inline double __now() noexcept nogil:
+    """Monotonic time in seconds, the clock of time.perf_counter."""
+    cdef timespec t
+    clock_gettime(CLOCK_MONOTONIC, &t)
+    return t.tv_sec + 1e-9 * t.tv_nsec
+
+
 ### selection methods
 
 
@@ -61,46 +81,592 @@ cdef void __chol_update(double[::1, :] L, int i, int k):
     blas.dscal(&M, &alpha, y, &incy)
 
 
-cdef long[::1] __entropy_chol(double[:, ::1] x, Kernel *kernel, int s):
+cdef long[::1] __entropy_chol(
+    double[:, ::1] x,
+    Kernel *kernel,
+    int s,
+    long[::1] fixed,
+    long[::1] forbidden,
+    double[:, ::1] marks,
+):
     """Returns a list of the most entropic points in x greedily."""
     cdef:
-        int n, i, j, k
+        int n, f, i, j, k
+        bint profiled
         double v
         long[::1] indexes
         double[::1, :] L
         double[::1] cond_var
 
     n = x.shape[0]
-    s = min(s, n)
+    f = fixed.shape[0]
+    # phases are timed only when given space for the timestamps
+    profiled = marks.shape[0] > 0
+    s = min(s, n - np.union1d(fixed, forbidden).shape[0])
     # initialization
     indexes = np.zeros(s, dtype=np.int64)
-    L = np.zeros((n, s), order="F")
+    L = np.zeros((n, f + s), order="F")
     cond_var = np.zeros(n)
     variance_vector(kernel, x, &cond_var[0])
+    __condition_fixed(x, kernel, L, cond_var, fixed)
+    for j in range(forbidden.shape[0]):
+        cond_var[forbidden[j]] = -1
 
-    for i in range(s):
+    for i in range(f, f + s):
+        if profiled:
+            marks[i - f, 0] = __now()
         # pick best entry
         k = __argmax(cond_var)
-        indexes[i] = k
+        indexes[i - f] = k
+        if profiled:
+            marks[i - f, 1] = __now()
         # update Cholesky factor
         covariance_vector(kernel, x, x[k], &L[0, i])
+        if profiled:
+            marks[i - f, 2] = __now()
         __chol_update(L, i, k)
+        if profiled:
+            marks[i - f, 3] = __now()
         # update conditional variance
-        for j in range(n):
+        for j in prange(n, nogil=True, schedule="static"):
             v = L[j, i]
             cond_var[j] -= v * v
         # clear out selected index
         cond_var[k] = -1
+        if profiled:
+            marks[i - f, 4] = __now()
+
+    return indexes
+
+
+cdef int __pivoted_chol(
+    double[::1, :] cov,
+    double[::1, :] L,
+    long[::1] pivots,
+    int m,
+    double bound,
+):
+    """Partial Cholesky factor of cov with at most m greedy pivots."""
+    cdef:
+        int p, i, j, k
+        double v
+        double[::1] cond_var
+
+    p = cov.shape[0]
+    cond_var = np.zeros(p)
+    for j in range(p):
+        cond_var[j] = cov[j, j]
+
+    for i in range(m):
+        # pick best entry
+        k = __argmax(cond_var)
+        # stop early once the best pivot no longer beats the bound
+        if i > 0 and (k < 0 or cond_var[k] <= bound):
+            return i
+        pivots[i] = k
+        # update Cholesky factor
+        for j in range(p):
+            L[j, i] = cov[j, k]
+        __chol_update(L, i, k)
+        # update conditional variance
+        for j in range(p):
+            v = L[j, i]
+            cond_var[j] -= v * v
+        cond_var[k] = -1
+    return m
+
+
+cdef void __syrk(double[::1, :] cov, double[::1, :] rows):
+    """Subtracts the outer product rows rows^T from cov in-place."""
+    cdef:
+        char *uplo
+        char *trans
+        int N, K, lda, ldc, i, j
+        double alpha, beta
+
+    uplo = 'l'
+    trans = 'n'
+    N = cov.shape[0]
+    K = rows.shape[1]
+    alpha = -1
+    lda = rows.shape[0]
+    beta = 1
+    ldc = cov.shape[0]
+    blas.dsyrk(uplo, trans, &N, &K, &alpha, &rows[0, 0], &lda,
+               &beta, &cov[0, 0], &ldc)
+    # symmetrize from the lower triangle
+    for j in range(N):
+        for i in range(j):
+            cov[i, j] = cov[j, i]
+
+
+cdef void __chol_update_block(
+    double[::1, :] L, int i, int m, double[::1, :] rows, double[::1, :] R
+):
+    """Updates columns i to i + m of L with rows of L and their factor R."""
+    cdef:
+        char *transa
+        char *transb
+        char *side
+        char *uplo
+        char *diag
+        int M, N, K, lda, ldb, ldc
+        double alpha, beta
+
+    M = L.shape[0]
+    N = m
+    lda = L.shape[0]
+    ldc = L.shape[0]
+    if i > 0:
+        transa = 'n'
+        transb = 't'
+        K = i
+        alpha = -1
+        ldb = rows.shape[0]
+        beta = 1
+        blas.dgemm(transa, transb, &M, &N, &K, &alpha, &L[0, 0], &lda,
+                   &rows[0, 0], &ldb, &beta, &L[0, i], &ldc)
+    # solve X R^T = B for the new columns
+    side = 'r'
+    uplo = 'l'
+    transa = 't'
+    diag = 'n'
+    alpha = 1
+    ldb = R.shape[0]
+    blas.dtrsm(side, uplo, transa, diag, &M, &N, &alpha, &R[0, 0], &ldb,
+               &L[0, i], &ldc)
+
+
+cdef void __condition_fixed(
+    double[:, ::1] x,
+    Kernel *kernel,
+    double[::1, :] L,
+    double[::1] cond_var,
+    long[::1] fixed,
+):
+    """Condition the first columns of L on the fixed points at once."""
+    cdef:
+        char *uplo
+        int n, f, info, i, j
+        double v
+        double[::1, :] R
+        double[:, ::1] points
+
+    n = x.shape[0]
+    f = fixed.shape[0]
+    if f == 0:
+        return
+    # blocked Cholesky factor of the covariance of the fixed points
+    points = np.ascontiguousarray(np.asarray(x)[fixed])
+    R = np.zeros((f, f), order="F")
+    for j in range(f):
+        covariance_vector(kernel, points, points[j], &R[0, j])
+    uplo = 'l'
+    lapack.dpotrf(uplo, &f, &R[0, 0], &f, &info)
+    if info != 0:
+        raise np.linalg.LinAlgError("Matrix is not positive definite")
+    # cross-covariance, then L[:, :f] R^T = K[:, fixed] by one trsm
+    for j in range(f):
+        covariance_vector(kernel, x, points[j], &L[0, j])
+    __chol_update_block(L, 0, f, R, R)
+    # update conditional variance
+    for j in range(f):
+        for i in prange(n, nogil=True, schedule="static"):
+            v = L[i, j]
+            cond_var[i] -= v * v
+    for j in range(f):
+        cond_var[fixed[j]] = -1
+
+
+cdef long[::1] __entropy_batch(
+    double[:, ::1] x, Kernel *kernel, int s, int b, int pool
+):
+    """Returns a list of the most entropic points in x greedily in batches."""
+    cdef:
+        int n, i, j, k, l, m, p
+        double v, bound
+        long[::1] indexes, order, top, pivots
+        double[::1, :] L, cov, factor, R, rows
+        double[::1] cond_var
+        double[:, ::1] points
+
+    n = x.shape[0]
+    s = min(s, n)
+    # initialization
+    indexes = np.zeros(s, dtype=np.int64)
+    L = np.zeros((n, s), order="F")
+    cond_var = np.zeros(n)
+    variance_vector(kernel, x, &cond_var[0])
+
+    i = 0
+    while i < s:
+        m = min(b, s - i)
+        # greedily pick a batch from a pool of the most entropic entries
+        p = min(max(pool, b), n - i)
+        order = np.argsort(np.negative(cond_var), kind="stable")
+        top = order[:p]
+        # variances only decrease, so no point outside the pool can beat
+        # the largest variance outside it and the batch is the exact
+        # greedy selection until the pool's best falls to that bound
+        bound = cond_var[order[p]] if p < n else -np.inf
+        points = np.asarray(x)[top]
+        cov = np.zeros((p, p), order="F")
+        for j in range(p):
+            covariance_vector(kernel, points, points[j], &cov[0, j])
+        rows = np.asfortranarray(np.asarray(L)[top, :i])
+        if i > 0:
+            __syrk(cov, rows)
+        factor = np.zeros((p, m), order="F")
+        pivots = np.zeros(m, dtype=np.int64)
+        m = __pivoted_chol(cov, factor, pivots, m, bound)
+        # update Cholesky factor by left looking with a blocked update
+        R = np.zeros((m, m), order="F")
+        rows = np.zeros((m, i), order="F")
+        for j in range(m):
+            k = top[pivots[j]]
+            indexes[i + j] = k
+            for l in range(m):
+                R[j, l] = factor[pivots[j], l]
+            for l in range(i):
+                rows[j, l] = L[k, l]
+            covariance_vector(kernel, x, x[k], &L[0, i + j])
+        __chol_update_block(L, i, m, rows, R)
+        # update conditional variance
+        for l in range(i, i + m):
+            for j in prange(n, nogil=True, schedule="static"):
+                v = L[j, l]
+                cond_var[j] -= v * v
+        # clear out selected indices
+        for j in range(m):
+            cond_var[indexes[i + j]] = -1
+        i += m
+
+    return indexes
+
+
+cdef double[::1, :] __prec_chol(
+    double[:, ::1] x, Kernel *kernel, unsigned char[::1] candidates
+):
+    """Lower triangular L such that L L^T is the precision of candidates."""
+    cdef:
+        char *uplo
+        char *diag
+        int n, info, i, j, r, c
+        double v
+        double[::1, :] L
+        double[:, ::1] points
+
+    n = x.shape[0]
+    # Cholesky factor of the covariance in reverse ordering
+    points = np.ascontiguousarray(np.asarray(x)[::-1])
+    L = np.zeros((n, n), order="F")
+    for j in range(n):
+        covariance_vector(kernel, points, points[j], &L[0, j])
+    # points that aren't candidates are independent of every other point
+    for j in range(n):
+        if not candidates[n - 1 - j]:
+            for i in range(n):
+                L[i, j] = 0
+                L[j, i] = 0
+            L[j, j] = 1
+    uplo = 'l'
+    diag = 'n'
+    lapack.dpotrf(uplo, &n, &L[0, 0], &n, &info)
+    if info != 0:
+        raise np.linalg.LinAlgError("Matrix is not positive definite")
+    lapack.dtrtri(uplo, diag, &n, &L[0, 0], &n, &info)
+    for j in range(n):
+        for i in range(j):
+            L[i, j] = 0
+    # reversing the inverse factor and transposing gives a lower factor
+    for j in range(n):
+        for i in range(j, n - 1 - j):
+            r, c = n - 1 - j, n - 1 - i
+            v = L[i, j]
+            L[i, j] = L[r, c]
+            L[r, c] = v
+    return L
+
+
+cdef void __row_norms(
+    double[::1, :] L, unsigned char[::1] candidates, double[::1] norms
+):
+    """Squared norm of each candidate row of the lower triangular L."""
+    cdef:
+        int n, i, j
+        double v
+
+    n = L.shape[0]
+    # one parallel region with each row summed by a single thread, row j
+    # has j + 1 columns so later chunks are handed out as threads free up
+    for j in prange(n, nogil=True, schedule="guided"):
+        v = 0
+        for i in range(j + 1):
+            if candidates[i]:
+                v = v + L[j, i] * L[j, i]
+        norms[j] = v
+
+
+cdef void __chol_downdate(
+    double[::1, :] L, double[::1] u, unsigned char[::1] candidates, int k
+):
+    """Computes the rank-one downdate in-place, L -> chol(L L^T - u u^T)."""
+    cdef:
+        int n, m, i
+        double c1, c2, dp
+
+    n = L.shape[0]
+    for i in range(k):
+        # removed columns are zero
+        if not candidates[i]:
+            continue
+        c1, c2 = L[i, i], u[i]
+        dp = sqrt(c1 * c1 - c2 * c2)
+        c1, c2 = c1 / dp, c2 / dp
+        # entries above the diagonal are zero in both L[:, i] and u
+        m = n - i
+        mkl.cblas_daxpby(m, -c2, &u[i], 1, c1, &L[i, i], 1)
+        mkl.cblas_daxpby(m, -c2 / c1, &L[i, i], 1, 1 / c1, &u[i], 1)
+
+
+cdef void __prec_update(
+    double[::1, :] L, double[::1] u, unsigned char[::1] candidates, int k
+):
+    """Marginalizes the kth point out of the precision with factor L."""
+    cdef:
+        char *trans
+        int M, N, lda, incx, incy, j
+        double alpha, beta
+
+    # u = L L[k] is the kth column of the precision, L[k] is zero past k
+    trans = 'n'
+    M = L.shape[0]
+    N = k + 1
+    alpha = 1
+    lda = L.shape[0]
+    incx = lda
+    beta = 0
+    incy = 1
+    blas.dgemv(trans, &M, &N, &alpha, &L[0, 0], &lda, &L[k, 0], &incx,
+               &beta, &u[0], &incy)
+    alpha = 1/sqrt(u[k])
+    blas.dscal(&M, &alpha, &u[0], &incy)
+    # marginalization in covariance is conditioning in precision
+    __chol_downdate(L, u, candidates, k)
+    # remove the kth row and column in-place
+    candidates[k] = False
+    for j in range(M):
+        L[k, j] = 0
+        L[j, k] = 0
+
+
+cdef long[::1] __mi_chol(
+    double[:, ::1] x,
+    Kernel *kernel,
+    int s,
+    long[::1] fixed,
+    long[::1] forbidden,
+    double[:, ::1] marks,
+):
+    """Max mutual information between selected and non-selected points."""
+    cdef:
+        int n, f, i, j, k
+        bint profiled
+        double v
+        long[::1] indexes
+        unsigned char[::1] candidates
+        double[::1, :] L1, L2
+        double[::1] cond_var1, cond_var2, u, score
+
+    n = x.shape[0]
+    f = fixed.shape[0]
+    # phases are timed only when given space for the timestamps
+    profiled = marks.shape[0] > 0
+    s = min(s, n - np.union1d(fixed, forbidden).shape[0])
+    # initialization
+    indexes = np.zeros(s, dtype=np.int64)
+    candidates = np.ones(n, dtype=np.uint8)
+    for j in range(f):
+        candidates[fixed[j]] = False
+    L1 = np.zeros((n, f + s), order="F")
+    cond_var1 = np.zeros(n)
+    variance_vector(kernel, x, &cond_var1[0])
+    __condition_fixed(x, kernel, L1, cond_var1, fixed)
+    # forbidden points stay in the complement but are never selected
+    for j in range(forbidden.shape[0]):
+        cond_var1[forbidden[j]] = -1
+    L2 = __prec_chol(x, kernel, candidates)
+    # fixed points are removed from the precision
+    for k in range(f):
+        for j in range(n):
+            L2[fixed[k], j] = 0
+            L2[j, fixed[k]] = 0
+    # the full conditional of i corresponds to the ith diagonal in precision
+    cond_var2 = np.zeros(n)
+    __row_norms(L2, candidates, cond_var2)
+    u = np.zeros(n)
+    score = np.zeros(n)
+
+    for i in range(f, f + s):
+        if profiled:
+            marks[i - f, 0] = __now()
+        # pick best entry
+        for j in range(n):
+            score[j] = cond_var1[j] * cond_var2[j] if candidates[j] else -1
+        k = __argmax(score)
+        indexes[i - f] = k
+        if profiled:
+            marks[i - f, 1] = __now()
+        # update Cholesky factor
+        covariance_vector(kernel, x, x[k], &L1[0, i])
+        if profiled:
+            marks[i - f, 2] = __now()
+        __chol_update(L1, i, k)
+        if profiled:
+            marks[i - f, 3] = __now()
+        # update conditional variance
+        for j in prange(n, nogil=True, schedule="static"):
+            v = L1[j, i]
+            cond_var1[j] -= v * v
+        cond_var1[k] = -1
+        if profiled:
+            marks[i - f, 4] = __now()
+        # update Cholesky factor of precision of candidates
+        __prec_update(L2, u, candidates, k)
+        if profiled:
+            marks[i - f, 5] = __now()
+        # update conditional variance of candidates
+        __row_norms(L2, candidates, cond_var2)
+        if profiled:
+            marks[i - f, 6] = __now()
 
     return indexes
 
 
 ### wrapper functions
 
+# phases timed by the selection methods, in order
+_ENTROPY_CHOL_PHASES = ["argmax", "kernel", "update", "variance"]
+_MI_CHOL_PHASES = _ENTROPY_CHOL_PHASES + ["downdate", "prec variance"]
 
-def entropy_chol(double[:, ::1] x, kernel_object, int s) -> np.ndarray:
+
+cdef (int, int) __set_threads(int omp_threads, int mkl_threads):
+    """Set the number of OpenMP and MKL threads, returning the previous."""
+    cdef int prev_omp, prev_mkl
+    prev_omp = omp_get_max_threads()
+    omp_set_num_threads(omp_threads)
+    prev_mkl = mkl.mkl_set_num_threads_local(mkl_threads)
+    return prev_omp, prev_mkl
+
+
+def entropy_chol(
+    double[:, ::1] x,
+    kernel_object,
+    int s,
+    fixed=None,
+    forbidden=None,
+    int threads=0,
+) -> np.ndarray:
     """Returns a list of the most entropic points in x greedily."""
-    cdef Kernel *kernel = get_kernel(kernel_object)
-    selected = __entropy_chol(x, kernel, s)
-    kernel_cleanup(kernel)
+    cdef:
+        Kernel *kernel
+        int omp_threads, mkl_threads
+        long[::1] fixed_indexes, forbidden_indexes
+        double[:, ::1] marks
+
+    fixed_indexes = np.asarray([] if fixed is None else fixed, np.int64)
+    forbidden_indexes = np.asarray(
+        [] if forbidden is None else forbidden, np.int64
+    )
+    # timestamps for each phase of each selection if profiling
+    clock = __clock("cython entropy_chol", x.shape[0], x.shape[1])
+    phases = _ENTROPY_CHOL_PHASES
+    marks = np.zeros((0 if clock is None else s, len(phases) + 1))
+    # zero threads uses the default number of threads
+    omp_threads, mkl_threads = 0, 0
+    if threads > 0:
+        omp_threads, mkl_threads = __set_threads(threads, threads)
+    kernel = get_kernel(kernel_object)
+    try:
+        selected = __entropy_chol(
+            x, kernel, s, fixed_indexes, forbidden_indexes, marks
+        )
+    finally:
+        kernel_cleanup(kernel)
+        if threads > 0:
+            __set_threads(omp_threads, mkl_threads)
+    if clock is not None:
+        clock.replay(
+            phases, np.asarray(marks), selected, offset=len(fixed_indexes)
+        )
+    return np.asarray(selected)
+
+
+def entropy_batch(
+    double[:, ::1] x,
+    kernel_object,
+    int s,
+    int b=16,
+    int pool=256,
+    int threads=0,
+) -> np.ndarray:
+    """Returns a list of the most entropic points in x greedily in batches."""
+    cdef:
+        Kernel *kernel
+        int omp_threads, mkl_threads
+
+    # zero threads uses the default number of threads
+    omp_threads, mkl_threads = 0, 0
+    if threads > 0:
+        omp_threads, mkl_threads = __set_threads(threads, threads)
+    kernel = get_kernel(kernel_object)
+    try:
+        selected = __entropy_batch(x, kernel, s, b, pool)
+    finally:
+        kernel_cleanup(kernel)
+        if threads > 0:
+            __set_threads(omp_threads, mkl_threads)
+    return np.asarray(selected)
+
+
+def mi_chol(
+    double[:, ::1] x,
+    kernel_object,
+    int s,
+    fixed=None,
+    forbidden=None,
+    int threads=0,
+) -> np.ndarray:
+    """Max mutual information between selected and non-selected points."""
+    cdef:
+        Kernel *kernel
+        int omp_threads, mkl_threads
+        long[::1] fixed_indexes, forbidden_indexes
+        double[:, ::1] marks
+
+    fixed_indexes = np.asarray([] if fixed is None else fixed, np.int64)
+    forbidden_indexes = np.asarray(
+        [] if forbidden is None else forbidden, np.int64
+    )
+    # timestamps for each phase of each selection if profiling
+    clock = __clock("cython mi_chol", x.shape[0], x.shape[1])
+    phases = _MI_CHOL_PHASES
+    marks = np.zeros((0 if clock is None else s, len(phases) + 1))
+    # zero threads uses the default number of threads
+    omp_threads, mkl_threads = 0, 0
+    if threads > 0:
+        omp_threads, mkl_threads = __set_threads(threads, threads)
+    kernel = get_kernel(kernel_object)
+    try:
+        selected = __mi_chol(
+            x, kernel, s, fixed_indexes, forbidden_indexes, marks
+        )
+    finally:
+        kernel_cleanup(kernel)
+        if threads > 0:
+            __set_threads(omp_threads, mkl_threads)
+    if clock is not None:
+        clock.replay(
+            phases, np.asarray(marks), selected, offset=len(fixed_indexes)
+        )
     return np.asarray(selected)
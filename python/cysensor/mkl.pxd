@@ -6,6 +6,9 @@ cdef extern from "mkl.h":
                       const double alpha, const double *X, const MKL_INT incX,
                       const double beta, double *Y, const MKL_INT incY)
 
+    # threading control
+    int mkl_set_num_threads_local(int nt)
+
     # vector math library (VML) routines
     void vdSqrt(const MKL_INT n, const double a[], double r[])
     void vdExp(const MKL_INT n, const double a[], double r[])
@@ -1,3 +1,27 @@
-from .jaxsensor import entropy, mi
+from .jaxsensor import (
+    bucket,
+    enable_cache,
+    entropy,
+    entropy_batched,
+    entropy_bucketed,
+    mi,
+    mi_batched,
+    mi_bucketed,
+    mi_chol,
+    pad,
+    stack,
+)
 
-__all__ = ["entropy", "mi"]
+__all__ = [
+    "bucket",
+    "enable_cache",
+    "entropy",
+    "entropy_batched",
+    "entropy_bucketed",
+    "mi",
+    "mi_batched",
+    "mi_bucketed",
+    "mi_chol",
+    "pad",
+    "stack",
+]
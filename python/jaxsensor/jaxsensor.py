@@ -4,13 +4,18 @@ from typing import TypeAlias
 
 import jax
 import jax.numpy as jnp
+import numpy as np
 from flax import nnx
 from gpjax.kernels import DenseKernelComputation
 from jax import Array, lax
+from jax.experimental.compilation_cache import compilation_cache
 from jax.numpy.linalg import inv
 
 Kernel = tuple[nnx.GraphDef, nnx.State]
 
+# number of factor columns multiplied at once
+BLOCK = 32
+
 dense = DenseKernelComputation()
 cross_covariance = dense.cross_covariance
 diagonal = dense.diagonal
@@ -37,6 +42,11 @@ def index_dtype(x: Array, unsigned: bool = True):
     return dtypes[bisect_left(sizes, x.shape[0] - 1)]
 
 
+def padded(s: int) -> int:
+    """Round the number of columns s up to a multiple of the block size."""
+    return -(-s // BLOCK) * BLOCK
+
+
 @jit
 def argmax_masked(x: Array, mask: Array) -> Array:
     """Argmax of x restricted to the indices in mask, including nans."""
@@ -48,12 +58,20 @@ def __chol_update(
     cond_var: Array, factor: Array, i: int, k: int | Array
 ) -> tuple[Array, Array]:
     """Condition the i-th column of the Cholesky factor by the k-th point."""
-    n = cond_var.shape[0]
+    n, m = factor.shape
     # update Cholesky factor by left looking
-    # -factor[:, :i] @ factor[k, :i] is more efficient but size must be static
+    # -factor[:, :i] @ factor[k, :i] in blocks since size must be static
+    size = BLOCK if m % BLOCK == 0 else m
     row = factor[k]
     row = row.at[i].set(0.0)
-    factor = factor.at[:, i].add(-factor @ row)
+
+    def body_fun(j: int, col: Array) -> Array:
+        """Subtract the contribution of the j-th block of columns."""
+        block = lax.dynamic_slice_in_dim(factor, j * size, size, axis=1)
+        return col - block @ lax.dynamic_slice_in_dim(row, j * size, size)
+
+    col = lax.fori_loop(0, i // size + 1, body_fun, factor[:, i])
+    factor = factor.at[:, i].set(col)
     # https://github.com/google/jax/issues/19162
     factor = factor.at[:, i].multiply(jnp.reciprocal(jnp.sqrt(factor[k, i])))
     # update conditional variance
@@ -61,39 +79,55 @@ def __chol_update(
     return cond_var, factor
 
 
-@partial(jit, static_argnums=2)
-def entropy(x: Array, kernel: Kernel, s: int) -> Array:
-    """Greedily select the s most entropic points from x."""
+def __entropy(
+    x: Array,
+    kernel: Kernel,
+    s: int,
+    candidates: Array,
+    steps: int | Array | None = None,
+) -> Array:
+    """Greedily select the s most entropic points from the candidates."""
     kernel = nnx.merge(*kernel)
     n = x.shape[0]
     s = min(s, n)
     # initialization
     int_dtype = index_dtype(x)
     indices = jnp.zeros(s, dtype=int_dtype)
-    candidates = jnp.ones(n, dtype=jnp.bool_)
     cond_var = diagonal(kernel, x).diag
-    factor = jnp.zeros((n, s), dtype=cond_var.dtype)
+    factor = jnp.zeros((n, padded(s)), dtype=cond_var.dtype)
     State: TypeAlias = tuple[Array, Array, Array, Array]  # type: ignore
     state = (indices, candidates, cond_var, factor)
 
     def body_fun(i: int, state: State) -> State:
         """Select the best index on the i-th iteration."""
         indices, candidates, cond_var, factor = state
-        # pick best entry
-        k = argmax_masked(cond_var, candidates)
+        # pick best entry, scopes name the phases in jax.profiler traces
+        with jax.named_scope("argmax"):
+            k = argmax_masked(cond_var, candidates)
         # update data structures
-        cov_k = cross_covariance(kernel, x, x[k, jnp.newaxis])
-        factor = factor.at[:n, i].set(cov_k.flatten())
+        with jax.named_scope("kernel"):
+            cov_k = cross_covariance(kernel, x, x[k, jnp.newaxis])
+            factor = factor.at[:n, i].set(cov_k.flatten())
+        with jax.named_scope("update"):
+            cond_var, factor = __chol_update(cond_var, factor, i, k)
         return (
             indices.at[i].set(int_dtype(k)),
             candidates.at[k].set(False),
-            *__chol_update(cond_var, factor, i, k),
+            cond_var,
+            factor,
         )
 
-    indices, *_ = lax.fori_loop(0, s, body_fun, state)
+    steps = s if steps is None else jnp.minimum(steps, s)
+    indices, *_ = lax.fori_loop(0, steps, body_fun, state)
     return indices
 
 
+@partial(jit, static_argnums=2)
+def entropy(x: Array, kernel: Kernel, s: int) -> Array:
+    """Greedily select the s most entropic points from x."""
+    return __entropy(x, kernel, s, jnp.ones(x.shape[0], dtype=jnp.bool_))
+
+
 @partial(jit, static_argnums=2)
 def mi(x: Array, kernel: Kernel, s: int) -> Array:
     """Greedily select the s most informative points from x."""
@@ -105,7 +139,7 @@ def mi(x: Array, kernel: Kernel, s: int) -> Array:
     indices = jnp.zeros(s, dtype=int_dtype)
     candidates = jnp.ones(n, dtype=jnp.bool_)
     cond_var = diagonal(kernel, x).diag
-    factor = jnp.zeros((n, s), dtype=cond_var.dtype)
+    factor = jnp.zeros((n, padded(s)), dtype=cond_var.dtype)
     prec = inv(gram(kernel, x).to_dense())
     State: TypeAlias = tuple[Array, Array, Array, Array, Array]  # type: ignore
     state = (indices, candidates, cond_var, factor, prec)
@@ -114,16 +148,212 @@ def mi(x: Array, kernel: Kernel, s: int) -> Array:
         """Select the best index on the i-th iteration."""
         indices, candidates, cond_var, factor, prec = state
         # pick best entry
-        k = argmax_masked(cond_var * jnp.diagonal(prec), candidates)
+        with jax.named_scope("argmax"):
+            k = argmax_masked(cond_var * jnp.diagonal(prec), candidates)
         # update data structures
-        cov_k = cross_covariance(kernel, x, x[k, jnp.newaxis])
-        factor = factor.at[:n, i].set(cov_k.flatten())
+        with jax.named_scope("kernel"):
+            cov_k = cross_covariance(kernel, x, x[k, jnp.newaxis])
+            factor = factor.at[:n, i].set(cov_k.flatten())
+        with jax.named_scope("update"):
+            cond_var, factor = __chol_update(cond_var, factor, i, k)
+        with jax.named_scope("downdate"):
+            prec = prec.at[:].add(-jnp.outer(prec[k], prec[k]) / prec[k, k])
         return (
             indices.at[i].set(int_dtype(k)),
             candidates.at[k].set(False),
-            *__chol_update(cond_var, factor, i, k),
-            prec.at[:].add(-jnp.outer(prec[k], prec[k]) / prec[k, k]),
+            cond_var,
+            factor,
+            prec,
         )
 
     indices, *_ = lax.fori_loop(0, s, body_fun, state)
     return indices
+
+
+def __mi_chol(
+    x: Array,
+    kernel: Kernel,
+    s: int,
+    candidates: Array,
+    steps: int | Array | None = None,
+) -> Array:
+    """Greedily select the s most informative points from the candidates."""
+    kernel = nnx.merge(*kernel)
+    n = x.shape[0]
+    s = min(s, n)
+    # initialization
+    int_dtype = index_dtype(x)
+    indices = jnp.zeros(s, dtype=int_dtype)
+    cond_var = diagonal(kernel, x).diag
+    factor = jnp.zeros((n, padded(s)), dtype=cond_var.dtype)
+    # points that aren't candidates are independent of every other point
+    mask = candidates[:, jnp.newaxis] & candidates[jnp.newaxis, :]
+    prec = inv(jnp.where(mask, gram(kernel, x).to_dense(), jnp.identity(n)))
+    # the full conditional of i corresponds to the ith diagonal in precision
+    cond_prec = jnp.diagonal(prec)
+    # left looking Cholesky factor of the precision in selection order
+    prec_factor = jnp.zeros((n, padded(s)), dtype=cond_var.dtype)
+    State: TypeAlias = tuple[Array, ...]  # type: ignore
+    state = (indices, candidates, cond_var, factor, cond_prec, prec_factor)
+
+    def body_fun(i: int, state: State) -> State:
+        """Select the best index on the i-th iteration."""
+        indices, candidates, cond_var, factor, cond_prec, prec_factor = state
+        # pick best entry
+        with jax.named_scope("argmax"):
+            k = argmax_masked(cond_var * cond_prec, candidates)
+        # update data structures
+        with jax.named_scope("kernel"):
+            cov_k = cross_covariance(kernel, x, x[k, jnp.newaxis])
+            factor = factor.at[:n, i].set(cov_k.flatten())
+        with jax.named_scope("update"):
+            cond_var, factor = __chol_update(cond_var, factor, i, k)
+        # marginalization in covariance is conditioning in precision
+        with jax.named_scope("downdate"):
+            prec_factor = prec_factor.at[:n, i].set(prec[k])
+            cond_prec, prec_factor = __chol_update(
+                cond_prec, prec_factor, i, k
+            )
+        return (
+            indices.at[i].set(int_dtype(k)),
+            candidates.at[k].set(False),
+            cond_var,
+            factor,
+            cond_prec,
+            prec_factor,
+        )
+
+    steps = s if steps is None else jnp.minimum(steps, s)
+    indices, *_ = lax.fori_loop(0, steps, body_fun, state)
+    return indices
+
+
+@partial(jit, static_argnums=2)
+def mi_chol(x: Array, kernel: Kernel, s: int) -> Array:
+    """Greedily select the s most informative points from x."""
+    return __mi_chol(x, kernel, s, jnp.ones(x.shape[0], dtype=jnp.bool_))
+
+
+### batched selection over many candidate sets and kernels
+
+
+def stack(kernels: list[Kernel]) -> Kernel:
+    """Stack kernels with the same structure into a batched kernel."""
+    graphdef = kernels[0][0]
+    states = [state for _, state in kernels]
+    return graphdef, jax.tree_util.tree_map(
+        lambda *leaves: jnp.stack(leaves), *states
+    )
+
+
+def pad(xs: list[Array]) -> tuple[Array, Array]:
+    """Pad candidate sets to a common size with a mask of real points."""
+    n = max(x.shape[0] for x in xs)
+    x = jnp.stack([jnp.pad(x, ((0, n - x.shape[0]), (0, 0))) for x in xs])
+    candidates = jnp.stack([jnp.arange(n) < x.shape[0] for x in xs])
+    return x, candidates
+
+
+def __batched(
+    f, x: Array, kernel: Kernel, s: int, candidates: Array | None, chunk: int
+) -> Array:
+    """Map f over the leading axis of x, vectorizing chunk problems at once."""
+    graphdef, state = kernel
+    b = x.shape[0]
+    if candidates is None:
+        candidates = jnp.ones(x.shape[:2], dtype=jnp.bool_)
+    # repeat the last problem so the batch splits evenly into chunks
+    chunk = max(1, min(chunk, b))
+    pad = -b % chunk
+    batch = jax.tree_util.tree_map(
+        lambda a: jnp.pad(
+            a, ((0, pad),) + ((0, 0),) * (a.ndim - 1), mode="edge"
+        ).reshape(-1, chunk, *a.shape[1:]),
+        (x, state, candidates),
+    )
+    # a problem with fewer candidates than s stops once they run out, so
+    # its trailing indices are left as zero rather than a wrapped argmax
+    vectorized = jax.vmap(
+        lambda x, state, candidates: f(
+            x, (graphdef, state), s, candidates, jnp.sum(candidates)
+        )
+    )
+    indices = lax.map(lambda args: vectorized(*args), batch)
+    return indices.reshape(-1, *indices.shape[2:])[:b]
+
+
+@partial(jit, static_argnums=(2, 4))
+def entropy_batched(
+    x: Array,
+    kernel: Kernel,
+    s: int,
+    candidates: Array | None = None,
+    chunk: int = 8,
+) -> Array:
+    """Greedily select the s most entropic points from each batch of x."""
+    return __batched(__entropy, x, kernel, s, candidates, chunk)
+
+
+@partial(jit, static_argnums=(2, 4))
+def mi_batched(
+    x: Array,
+    kernel: Kernel,
+    s: int,
+    candidates: Array | None = None,
+    chunk: int = 8,
+) -> Array:
+    """Greedily select the s most informative points from each batch of x."""
+    return __batched(__mi_chol, x, kernel, s, candidates, chunk)
+
+
+### shape bucketing to reuse compiled programs
+
+
+def bucket(n: int) -> int:
+    """Round n up to the next power of two, at least the block size."""
+    return max(BLOCK, 1 << (n - 1).bit_length())
+
+
+def enable_cache(path: str) -> None:
+    """Persist compiled programs to path so restarts skip compilation."""
+    compilation_cache.set_cache_dir(path)
+    jax.config.update("jax_persistent_cache_min_compile_time_secs", 0)
+    # the cache is initialized on the first compile, which may have happened
+    compilation_cache.reset_cache()
+
+
+@partial(jit, static_argnums=2)
+def __entropy_bucket(
+    x: Array, kernel: Kernel, s: int, candidates: Array, steps: Array
+) -> Array:
+    """Entropy on a padded problem with a dynamic number of steps."""
+    return __entropy(x, kernel, s, candidates, steps)
+
+
+@partial(jit, static_argnums=2)
+def __mi_bucket(
+    x: Array, kernel: Kernel, s: int, candidates: Array, steps: Array
+) -> Array:
+    """Mutual information on a padded problem with a dynamic step count."""
+    return __mi_chol(x, kernel, s, candidates, steps)
+
+
+def __bucketed(f, x: Array, kernel: Kernel, s: int) -> Array:
+    """Pad n and s up to their buckets, then select with f."""
+    n = x.shape[0]
+    s = min(s, n)
+    size = bucket(n)
+    # pad on the host so new shapes don't compile padding kernels
+    points = np.pad(np.asarray(x), ((0, size - n), (0, 0)))
+    candidates = np.arange(size) < n
+    return f(points, kernel, min(bucket(s), size), candidates, s)[:s]
+
+
+def entropy_bucketed(x: Array, kernel: Kernel, s: int) -> Array:
+    """Greedily select the s most entropic points from x, bucketing shapes."""
+    return __bucketed(__entropy_bucket, x, kernel, s)
+
+
+def mi_bucketed(x: Array, kernel: Kernel, s: int) -> Array:
+    """Greedily select the s most informative points from x, bucketing."""
+    return __bucketed(__mi_bucket, x, kernel, s)
@@ -1,3 +1,8 @@
+import os
+import resource
+import subprocess
+import sys
+import tempfile
 import time
 
 import jax
@@ -10,6 +15,7 @@ from gpjax import kernels as jaxkernels
 
 import jaxsensor
 import pysensor as sensor
+from pysensor.kernels import Wendland
 
 try:
     import cysensor
@@ -65,6 +71,13 @@ def perturbed_grid(
     return points + rng.uniform(-delta, delta, points.shape)  # type: ignore
 
 
+def usage() -> tuple[float, float]:
+    """Peak resident set size and volume paged in from disk in MiB."""
+    r = resource.getrusage(resource.RUSAGE_SELF)
+    # ru_maxrss is in KiB and ru_inblock in 512 byte blocks on Linux
+    return r.ru_maxrss / 2**10, r.ru_inblock * 512 / 2**20
+
+
 if __name__ == "__main__":
     np.set_printoptions(precision=3, suppress=True)
     rng = np.random.default_rng(1)
@@ -83,11 +96,77 @@ if __name__ == "__main__":
     assert np.allclose(ans, indexes), "python entropy prechol wrong"
     indexes = sensor.entropy_chol(X, kernel, s)
     assert np.allclose(ans, indexes), "python entropy chol wrong"
+    indexes = sensor.entropy_batch(X, kernel, s, b=1)
+    assert np.allclose(ans, indexes), "python entropy batch wrong"
+    indexes = sensor.entropy_stream(X, kernel, s, tile=16)
+    assert np.allclose(ans, indexes), "python entropy stream wrong"
+    indexes = sensor.entropy_chol(X, kernel, s - 10, fixed=ans[:10])
+    assert np.allclose(ans[10:], indexes), "python entropy fixed wrong"
+    # forbidding a site in entropy is the same as removing it
+    keep = np.arange(10, len(X))
+    indexes = sensor.entropy_chol(X, kernel, 50, forbidden=np.arange(10))
+    ans_keep = keep[sensor.entropy_chol(X[keep], kernel, 50)]
+    assert np.allclose(ans_keep, indexes), "python entropy forbidden wrong"
+    selector = sensor.EntropySelector(X, kernel)
+    selector.extend(s - 25)
+    indexes = selector.extend(25)
+    assert np.array_equal(ans, indexes), "python entropy selector wrong"
+    # a run preempted after 30 selections resumes from its last save
+    with tempfile.TemporaryDirectory() as root:
+        checkpoint = sensor.Checkpoint(root, every=10)
+        indexes = sensor.entropy_chol(X, kernel, s, checkpoint=checkpoint)
+        assert np.array_equal(ans, indexes), "python entropy checkpoint wrong"
+        np.save(checkpoint.path("indexes"), ans[:30])
+        checkpoint = sensor.Checkpoint(root)
+        indexes = sensor.entropy_chol(X, kernel, s, checkpoint=checkpoint)
+        assert np.array_equal(ans, indexes), "python entropy resume wrong"
+    # duplicated candidates lose ties so a fresh run makes the same choices
+    selector = sensor.EntropySelector(X, kernel)
+    selector.extend(25)
+    selector.add_candidates(X[:20])
+    indexes = selector.extend(s - 25)
+    X_dup = np.concatenate((X, X[:20]))
+    ans_dup = sensor.entropy_chol(X_dup, kernel, s)
+    assert np.array_equal(ans_dup, indexes), "python entropy add wrong"
     if cython:
         indexes = cysensor.entropy_chol(X, kernel, s)  # pyright: ignore
         assert np.allclose(ans, indexes), "cython entropy chol wrong"
+        indexes = cysensor.entropy_batch(X, kernel, s, b=1)  # pyright: ignore
+        assert np.allclose(ans, indexes), "cython entropy batch wrong"
+    # many points outside the pool of a short length scale, where a stale
+    # pool would lose entropy, with the default batches and pools
+    X_batch = np.random.default_rng(2).random((2000, 2))
+    kernel_short = kernels.Matern(length_scale=0.1, nu=5 / 2)
+    expected = sensor.entropy_chol(X_batch, kernel_short, 100)
+    exact = sensor.entropy_objective(X_batch, kernel_short, expected)
+    methods = [sensor.entropy_batch]
+    if cython:
+        methods.append(cysensor.entropy_batch)  # pyright: ignore
+    for entropy_batch in methods:
+        for b in [16, 32]:
+            indexes = entropy_batch(X_batch, kernel_short, 100, b=b)
+            gap = exact - sensor.entropy_objective(
+                X_batch, kernel_short, indexes
+            )
+            assert gap <= 1e-9 * abs(exact), f"entropy batch b={b} lost"
+        indexes = cysensor.entropy_chol(  # pyright: ignore
+            X, kernel, s - 10, fixed=ans[:10]
+        )
+        assert np.allclose(ans[10:], indexes), "cython entropy fixed wrong"
+        indexes = cysensor.entropy_chol(  # pyright: ignore
+            X, kernel, 50, forbidden=np.arange(10)
+        )
+        assert np.allclose(ans_keep, indexes), "cython entropy forbidden wrong"
     indexes = jaxsensor.entropy(X, jaxkernel, s)
     assert jnp.allclose(ans, indexes), "jax entropy wrong"
+    indexes = jaxsensor.entropy_bucketed(X, jaxkernel, s)
+    assert jnp.allclose(ans, indexes), "jax entropy bucketed wrong"
+    # kernels are translated to whichever backend is picked
+    for backend in ["python", "jax"] + ["cython"] * cython:
+        indexes = sensor.select(X, kernel, s, backend=backend)
+        assert np.allclose(ans, indexes), f"select {backend} wrong"
+    indexes = sensor.select(X, jaxkernel, s)
+    assert np.allclose(ans, indexes), "select translated wrong"
 
     np.save("data/entropy_X.npy", X)
     np.save("data/entropy_indexes.npy", indexes)
@@ -97,12 +176,119 @@ if __name__ == "__main__":
     assert np.allclose(ans, indexes), "python mi prec wrong"
     indexes = sensor.mi_chol(X, kernel, s)
     assert np.allclose(ans, indexes), "python mi chol wrong"
+    indexes = sensor.mi_chol(X, kernel, s - 10, fixed=ans[:10])
+    assert np.allclose(ans[10:], indexes), "python mi fixed wrong"
+    fixed, forbidden = np.arange(5), np.arange(5, 15)
+    ans_forbidden = sensor.mi_chol(X, kernel, 50, fixed, forbidden)
+    assert not np.isin(ans_forbidden, forbidden).any(), "python mi forbidden"
+    indexes = sensor.select(X, kernel, s, "mi", backend="python")
+    assert np.array_equal(ans, indexes), "select python mi wrong"
+    try:
+        sensor.select(X, kernel, s, "mi", backend="jax", fixed=ans[:10])
+        raise AssertionError("select jax fixed wrong")
+    except ValueError as error:
+        assert "jax: fixed" in str(error), "select skip reason wrong"
+    indexes = sensor.mi_lazy(X, kernel, s)
+    assert np.allclose(ans, indexes), "python mi lazy wrong"
+    indexes = sensor.mi_local(X, kernel, s, n_neighbors=len(X))
+    assert np.allclose(ans, indexes), "python mi local wrong"
+    indexes = sensor.mi_lowrank(X, kernel, s, rank=len(X))
+    assert np.array_equal(ans, indexes), "python mi lowrank wrong"
+    # asking for more points than there are selects all of them
+    expected = sensor.mi_chol(X[:20], kernel, 25)
+    assert np.array_equal(np.sort(expected), np.arange(20)), "mi s > n wrong"
+    for mi in [sensor.mi_naive, sensor.mi_prec, sensor.mi_lazy]:
+        indexes = mi(X[:20], kernel, 25)
+        assert np.array_equal(expected, indexes), f"{mi.__name__} s > n"
+    selector = sensor.MISelector(X, kernel)
+    selector.extend(s - 25)
+    indexes = selector.extend(25)
+    assert np.array_equal(ans, indexes), "python mi selector wrong"
+    with tempfile.TemporaryDirectory() as root:
+        checkpoint = sensor.Checkpoint(root, every=10)
+        indexes = sensor.mi_chol(X, kernel, s, checkpoint=checkpoint)
+        assert np.array_equal(ans, indexes), "python mi checkpoint wrong"
+        np.save(checkpoint.path("indexes"), ans[:30])
+        checkpoint = sensor.Checkpoint(root)
+        indexes = sensor.mi_chol(X, kernel, s, checkpoint=checkpoint)
+        assert np.array_equal(ans, indexes), "python mi resume wrong"
+        # a save of another problem is started over rather than resumed
+        expected = sensor.mi_chol(X, kernel, s, forbidden=ans[:5])
+        indexes = sensor.mi_chol(
+            X, kernel, s, forbidden=ans[:5], checkpoint=checkpoint
+        )
+        assert np.array_equal(expected, indexes), "python mi fingerprint wrong"
+    # compactly supported kernels, plain, tapering a Matern and with noise
+    for compact in [
+        Wendland(length_scale=0.3),
+        kernels.Matern(length_scale=0.5, nu=3 / 2) * Wendland(0.4),
+        kernels.ConstantKernel(2) * Wendland(0.3) + kernels.WhiteKernel(0.1),
+    ]:
+        expected = sensor.entropy_chol(X, compact, s)
+        indexes = sensor.entropy_sparse(X, compact, s)
+        assert np.array_equal(expected, indexes), "python entropy sparse wrong"
+        expected = sensor.mi_chol(X, compact, s)
+        indexes = sensor.mi_sparse(X, compact, s)
+        assert np.array_equal(expected, indexes), "python mi sparse wrong"
+    if cython:
+        indexes = cysensor.mi_chol(X, kernel, s)  # pyright: ignore
+        assert np.allclose(ans, indexes), "cython mi chol wrong"
+        indexes = cysensor.mi_chol(  # pyright: ignore
+            X, kernel, s - 10, fixed=ans[:10]
+        )
+        assert np.allclose(ans[10:], indexes), "cython mi fixed wrong"
+        indexes = cysensor.mi_chol(  # pyright: ignore
+            X, kernel, 50, fixed, forbidden
+        )
+        assert np.allclose(ans_forbidden, indexes), "cython mi forbidden wrong"
     indexes = jaxsensor.mi(X, jaxkernel, s)
     assert jnp.allclose(ans, indexes), "jax mi wrong"
+    indexes = jaxsensor.mi_bucketed(X, jaxkernel, s)
+    assert jnp.allclose(ans, indexes), "jax mi bucketed wrong"
+    indexes = jaxsensor.mi_chol(X, jaxkernel, s)
+    assert jnp.allclose(ans, indexes), "jax mi chol wrong"
 
     np.save("data/mi_X.npy", X)
     np.save("data/mi_indexes.npy", indexes)
 
+    # ragged candidate sets with different hyperparameters
+    # the last has fewer points than selections, padded by trailing zeros
+    xs = [X, X[:80], X[:30]]
+    ks = [jaxkernel] + [
+        nnx.split(jaxkernels.Matern52(lengthscale=lengthscale))
+        for lengthscale in [0.5, 2]
+    ]
+    points, candidates = jaxsensor.pad(xs)
+    kernel_batch = jaxsensor.stack(ks)
+    batch = jaxsensor.entropy_batched(points, kernel_batch, 50, candidates)
+    for x, k, batched in zip(xs, ks, batch):
+        expected = jaxsensor.entropy(x, k, 50)
+        assert jnp.allclose(
+            expected, batched[: len(expected)]
+        ), "jax entropy batched wrong"
+        assert not batched[len(expected) :].any(), "jax entropy ragged wrong"
+    batch = jaxsensor.mi_batched(points, kernel_batch, 50, candidates)
+    for x, k, batched in zip(xs, ks, batch):
+        expected = jaxsensor.mi_chol(x, k, 50)
+        assert jnp.allclose(
+            expected, batched[: len(expected)]
+        ), "jax mi batched wrong"
+        assert not batched[len(expected) :].any(), "jax mi ragged wrong"
+
+    # approximation gap of local kernels
+
+    exact = sensor.mi_objective(X, kernel, ans)
+    for n_neighbors in [4, 8, 16, 32, 64]:
+        indexes = sensor.mi_local(X, kernel, s, n_neighbors=n_neighbors)
+        gap = (exact - sensor.mi_objective(X, kernel, indexes)) / exact
+        same = np.mean(indexes == ans)
+        print(f"mi local {n_neighbors:3}: gap {gap:10.3e} same {same:5.3f}")
+    for rank in [10, 25, 50, 100]:
+        indexes = sensor.mi_lowrank(X, kernel, s, rank=rank)
+        gap = (exact - sensor.mi_objective(X, kernel, indexes)) / exact
+        same = np.mean(indexes == ans)
+        print(f"mi rank  {rank:3}: gap {gap:10.3e} same {same:5.3f}")
+
     # graphing
 
     kernel = kernels.Matern(length_scale=1, nu=5 / 2)
@@ -209,7 +395,14 @@ if __name__ == "__main__":
 
     # exit()
 
-    # benchmarking
+    # benchmarking, benchmark.py compares the implementations
+
+    # cold start, pysensor imports neither jax nor sklearn until needed
+    for module in ["pysensor", "jaxsensor"]:
+        start = time.time()
+        subprocess.run([sys.executable, "-c", f"import {module}"], check=True)
+        t1 = time.time() - start
+        print(f"import {module:>9}: {t1:9.3e}")
 
     X = rng.random((10_000, 3))
     s = 200
@@ -217,62 +410,214 @@ if __name__ == "__main__":
     # entropy
 
     start = time.time()
-    indexes = sensor.entropy_naive(X, kernel, s)
-    t1 = t2 = time.time() - start
-    print(f"entropy   naive: {t1:9.3e} ({t1/t1:7.3f})")
+    indexes = sensor.entropy_chol(X, kernel, s)
+    t1 = time.time() - start
+    print(f"python     chol: {t1:9.3e} ({t1/t1:7.3f})")
 
+    # half of the sensors already exist and are conditioned on at once
     start = time.time()
-    indexes = sensor.entropy_prec(X, kernel, s)
-    # t1 = t2 = time.time() - start
+    indexes = sensor.entropy_chol(X, kernel, s // 2, fixed=indexes[: s // 2])
     t2 = time.time() - start
-    print(f"python     prec: {t2:9.3e} ({t1/t2:7.3f})")
+    print(f"python    fixed: {t2:9.3e} ({t1/t2:7.3f})")
 
+    # 20 more sensors, rerunning from scratch against resuming
     start = time.time()
-    indexes = sensor.entropy_prechol(X, kernel, s)
-    t2 = time.time() - start
-    print(f"python  prechol: {t2:9.3e} ({t1/t2:7.3f})")
+    indexes = sensor.entropy_chol(X, kernel, s + 20)
+    t3 = time.time() - start
+    print(f"python   rerun : {t3:9.3e} ({t3/t3:7.3f})")
 
+    selector = sensor.EntropySelector(X, kernel)
+    selector.extend(s)
     start = time.time()
-    indexes = sensor.entropy_chol(X, kernel, s)
+    indexes = selector.extend(20)
     t2 = time.time() - start
-    print(f"python     chol: {t2:9.3e} ({t1/t2:7.3f})")
+    print(f"python   extend: {t2:9.3e} ({t3/t2:7.3f})")
 
-    indexes = jaxsensor.entropy(X, jaxkernel, s).block_until_ready()
-    start = time.time()
-    indexes = jaxsensor.entropy(X, jaxkernel, s).block_until_ready()
-    t2 = time.time() - start
-    print(f"jax            : {t2:9.3e} ({t1/t2:7.3f})")
+    with tempfile.TemporaryDirectory() as root:
+        np.save(f"{root}/X.npy", X)
+        X_mmap = np.load(f"{root}/X.npy", mmap_mode="r")
+        _, before = usage()
+        start = time.time()
+        indexes = sensor.entropy_mmap(X_mmap, kernel, s, f"{root}/L.npy")
+        t2 = time.time() - start
+        rss, after = usage()
+        print(
+            f"python     mmap: {t2:9.3e} ({t1/t2:7.3f})"
+            f" (peak rss {rss:.1f} MiB, paged in {after - before:.1f} MiB)"
+        )
 
     if cython:
+        # exponentiation isn't specialized so k**1 takes the Python path
+        composite = kernels.ConstantKernel(2) * kernels.Matern(
+            length_scale=[1, 2, 0.5], nu=5 / 2
+        ) + kernels.WhiteKernel(1e-2)
+
         start = time.time()
-        indexes = cysensor.entropy_chol(X, kernel, s)  # pyright: ignore
+        indexes = cysensor.entropy_chol(X, composite**1, s)  # pyright: ignore
+        t3 = time.time() - start
+        print(f"cython fallback: {t3:9.3e} ({t3/t3:7.3f})")
+
+        start = time.time()
+        indexes = cysensor.entropy_chol(X, composite, s)  # pyright: ignore
         t2 = time.time() - start
-        print(f"cython     chol: {t2:9.3e} ({t1/t2:7.3f})")
+        print(f"cython   native: {t2:9.3e} ({t3/t2:7.3f})")
     else:
         print("skipping cython...")
 
-    # mutual information
+    # batched selection over many candidate sets and kernels
 
-    X = rng.random((1000, 3))
-    s = 100
+    xs = [rng.random((100, 3)) for _ in range(1000)]
+    ks = [
+        nnx.split(jaxkernels.Matern52(lengthscale=length_scale))
+        for length_scale in rng.uniform(0.5, 2, len(xs))
+    ]
+    s = 10
+    points, candidates = jaxsensor.pad(xs)
+    kernel_batch = jaxsensor.stack(ks)
 
+    for x, k in zip(xs, ks):
+        indexes = jaxsensor.entropy(x, k, s).block_until_ready()
     start = time.time()
-    indexes = sensor.mi_naive(X, kernel, s)
-    t1 = t2 = time.time() - start
-    print(f"mi        naive: {t1:9.3e} ({t1/t1:7.3f})")
+    for x, k in zip(xs, ks):
+        indexes = jaxsensor.entropy(x, k, s).block_until_ready()
+    t1 = time.time() - start
+    print(f"batch      loop: {t1:9.3e} ({t1/t1:7.3f})")
 
+    indexes = jaxsensor.entropy_batched(points, kernel_batch, s, candidates)
+    indexes.block_until_ready()
     start = time.time()
-    indexes = sensor.mi_prec(X, kernel, s)
+    indexes = jaxsensor.entropy_batched(points, kernel_batch, s, candidates)
+    indexes.block_until_ready()
     t2 = time.time() - start
-    print(f"python     prec: {t2:9.3e} ({t1/t2:7.3f})")
+    print(f"jax     batched: {t2:9.3e} ({t1/t2:7.3f})")
+
+    # independent problems on a process pool sharing their candidates
 
+    xs = [rng.random((2000, 3)) for _ in range(16)]
+    s = 50
     start = time.time()
-    indexes = sensor.mi_chol(X, kernel, s)
-    t2 = time.time() - start
-    print(f"python     chol: {t2:9.3e} ({t1/t2:7.3f})")
+    expected = [sensor.select(x, kernel, s, "mi") for x in xs]
+    t1 = time.time() - start
+    print(f"pool     serial: {t1:9.3e} ({t1/t1:7.3f})")
 
-    indexes = jaxsensor.mi(X, jaxkernel, s).block_until_ready()
     start = time.time()
-    indexes = jaxsensor.mi(X, jaxkernel, s).block_until_ready()
+    for i, indexes in sensor.select_many(xs, kernel, s, "mi"):
+        assert np.array_equal(expected[i], indexes), "select many wrong"
     t2 = time.time() - start
-    print(f"jax            : {t2:9.3e} ({t1/t2:7.3f})")
+    print(f"pool {os.cpu_count():3} procs: {t2:9.3e} ({t1/t2:7.3f})")
+
+    # spatial partitioning against the exact greedy, loss in nats/sensor
+
+    kernel_local = kernels.Matern(length_scale=0.1, nu=5 / 2)
+    for criterion, n, s in [("entropy", 4096, 100), ("mi", 1600, 40)]:
+        X = perturbed_grid(rng, n)
+        start = time.time()
+        exact = sensor.select(X, kernel_local, s, criterion)
+        t1 = time.time() - start
+        start = time.time()
+        indexes = sensor.select_partitioned(X, kernel_local, s, criterion)
+        t2 = time.time() - start
+        objective = getattr(sensor, f"{criterion}_objective")
+        loss = (
+            objective(X, kernel_local, exact)
+            - objective(X, kernel_local, indexes)
+        ) / s
+        print(
+            f"{criterion:>7} tiled: {t2:9.3e} ({t1/t2:7.3f}) loss {loss:.4f}"
+        )
+
+    # the variants below are timed by benchmark.py, only their selections
+    # are checked here
+
+    # checkpointing every 10 selections doesn't change them
+
+    X = rng.random((10_000, 3))
+    s = 200
+    expected = sensor.entropy_chol(X, kernel, s)
+    with tempfile.TemporaryDirectory(dir="data") as root:
+        checkpoint = sensor.Checkpoint(root, every=10)
+        indexes = sensor.entropy_chol(X, kernel, s, checkpoint=checkpoint)
+        assert np.array_equal(expected, indexes), "checkpoint wrong"
+        saved = np.load(checkpoint.path("indexes"))
+        assert np.array_equal(saved, indexes[: len(saved)]), "save wrong"
+
+    # float32 factor accumulated in float64 loses little, in nats/sensor
+
+    for length_scale in [0.05, 0.1, 0.3, 1.0]:
+        kernel_scaled = kernels.Matern(length_scale=length_scale, nu=5 / 2)
+        expected = sensor.entropy_chol(X, kernel_scaled, s)
+        indexes = sensor.entropy_chol(X, kernel_scaled, s, dtype=np.float32)
+        loss = (
+            sensor.entropy_objective(X, kernel_scaled, expected)
+            - sensor.entropy_objective(X, kernel_scaled, indexes)
+        ) / s
+        assert loss < 1e-2, f"float32 {length_scale} lost {loss:.2e}"
+
+    # sparse factors for a compactly supported kernel
+
+    for criterion, n, s, radius in [
+        ("entropy", 10_000, 200, 0.05),
+        ("mi", 2000, 50, 0.05),
+    ]:
+        X = rng.random((n, 2))
+        compact = Wendland(length_scale=radius)
+        expected = getattr(sensor, f"{criterion}_chol")(X, compact, s)
+        indexes = getattr(sensor, f"{criterion}_sparse")(X, compact, s)
+        assert np.array_equal(expected, indexes), f"{criterion} sparse wrong"
+
+    # low rank precision of the non-selected points, relative MI gap
+
+    X = rng.random((4000, 3))
+    s = 100
+    exact = sensor.mi_chol(X, kernel, s)
+    indexes = sensor.mi_lowrank(X, kernel, s, rank=400)
+    gap = (
+        sensor.mi_objective(X, kernel, exact)
+        - sensor.mi_objective(X, kernel, indexes)
+    ) / sensor.mi_objective(X, kernel, exact)
+    assert gap < 0.25, f"mi lowrank gap {gap:.2e}"
+
+    # shape bucketing and persistent compilation
+
+    with tempfile.TemporaryDirectory() as root:
+        jaxsensor.enable_cache(root)
+        for n, s in [(100, 10), (120, 20), (500, 50)]:
+            X = rng.random((n, 2))
+            for name, f in [
+                ("entropy", jaxsensor.entropy_bucketed),
+                ("mi", jaxsensor.mi_bucketed),
+            ]:
+                expected = getattr(jaxsensor, name)(X, jaxkernel, s)
+                indexes = f(X, jaxkernel, s)
+                assert np.array_equal(expected, indexes), f"{name} bucketed"
+
+        # a restarted worker reads the executable from disk
+        jax.clear_caches()
+        indexes = jaxsensor.entropy_bucketed(X, jaxkernel, s)
+        expected = jaxsensor.entropy(X, jaxkernel, s)
+        assert np.array_equal(expected, indexes), "entropy cached wrong"
+
+    # per-phase profile, the trace loads in chrome://tracing or Perfetto
+
+    X = rng.random((2000, 3))
+    s = 100
+    expected = [
+        sensor.entropy_chol(X, kernel, s),
+        sensor.mi_chol(X, kernel, s),
+    ]
+    with sensor.Profiler() as profiler:
+        profiled = [
+            sensor.entropy_chol(X, kernel, s),
+            sensor.mi_chol(X, kernel, s),
+        ]
+        if cython:
+            profiled += [
+                cysensor.entropy_chol(X, kernel, s),  # pyright: ignore
+                cysensor.mi_chol(X, kernel, s),  # pyright: ignore
+            ]
+    # instrumentation doesn't change the selections
+    for i, indexes in enumerate(profiled):
+        assert np.allclose(indexes, expected[i % 2])
+    print(profiler.summary())
+    with tempfile.TemporaryDirectory() as root:
+        profiler.save(f"{root}/trace.json")
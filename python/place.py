@@ -0,0 +1,169 @@
+import argparse
+import mmap
+import os
+import sys
+import time
+from collections import deque
+from collections.abc import Callable, Iterator
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
+
+import numpy as np
+from sklearn.gaussian_process import kernels
+
+import pysensor as sensor
+
+# sklearn kernels by name, gpjax kernels are translated by select()
+KERNELS: dict[str, Callable[[float], kernels.Kernel]] = {
+    "matern12": lambda length_scale: kernels.Matern(length_scale, nu=1 / 2),
+    "matern32": lambda length_scale: kernels.Matern(length_scale, nu=3 / 2),
+    "matern52": lambda length_scale: kernels.Matern(length_scale, nu=5 / 2),
+    "rbf": lambda length_scale: kernels.RBF(length_scale),
+    "rq": lambda length_scale: kernels.RationalQuadratic(length_scale),
+}
+
+Job = tuple[str, Callable[[], np.ndarray]]
+
+
+def jobs(paths: list[str]) -> Iterator[Job]:
+    """Name and loader of each candidate set in the files or directories."""
+    for path in paths:
+        if os.path.isdir(path):
+            yield from jobs(
+                sorted(
+                    os.path.join(path, name)
+                    for name in os.listdir(path)
+                    if name.endswith((".npy", ".npz"))
+                )
+            )
+            continue
+        stem = os.path.splitext(os.path.basename(path))[0]
+        if path.endswith(".npz"):
+            # every array in an archive is its own candidate set
+            with np.load(path) as archive:
+                names = archive.files
+            for name in names:
+                yield f"{stem}/{name}", partial(load, path, name)
+        else:
+            yield stem, partial(load, path)
+
+
+def load(path: str, name: str | None = None) -> np.ndarray:
+    """Read candidates into memory, paging .npy files in from a map."""
+    if name is None:
+        # copy-on-write, compiled backends need a writable buffer
+        X = np.load(path, mmap_mode="c")
+    else:
+        # archive members are zipped so they can't be memory-mapped
+        with np.load(path) as archive:
+            X = archive[name]
+    # a single coordinate per point
+    if X.ndim == 1:
+        X = X[:, np.newaxis]
+    if X.ndim != 2:
+        raise ValueError(f"Candidates must be (n, d), not {X.shape}")
+    if (
+        isinstance(X, np.memmap)
+        and X.dtype == np.float64
+        and X.flags.c_contiguous
+    ):
+        # reading a value per page faults the map in on the loading thread
+        X.reshape(-1)[:: mmap.PAGESIZE // X.itemsize].sum()
+        return X
+    # other dtypes and layouts are copied, faulting the pages in as well
+    return np.ascontiguousarray(X, dtype=np.float64)
+
+
+def prefetch(queue: Iterator[Job], depth: int) -> Iterator[tuple[str, Future]]:
+    """Start loading candidate sets ahead of the one being placed."""
+    pending: deque[tuple[str, Future]] = deque()
+    # one thread keeps the disk busy, numpy and zlib release the GIL
+    with ThreadPoolExecutor(max_workers=1) as loader:
+        while True:
+            while len(pending) <= depth and (job := next(queue, None)):
+                name, f = job
+                pending.append((name, loader.submit(f)))
+            if not pending:
+                return
+            yield pending.popleft()
+
+
+def place(
+    X: np.ndarray, kernel: kernels.Kernel, args: argparse.Namespace
+) -> tuple[np.ndarray, np.ndarray]:
+    """Selected indexes and their variances conditional on earlier picks."""
+    indexes = sensor.select(
+        X, kernel, args.s, criterion=args.criterion, backend=args.backend
+    )
+    return indexes, sensor.conditional_variances(X, kernel, indexes)
+
+
+def parse_args() -> argparse.Namespace:
+    """Parse the inputs, selector and output options."""
+    parser = argparse.ArgumentParser(
+        description="Place sensors in each candidate set of .npy/.npz files."
+    )
+    parser.add_argument(
+        "inputs",
+        nargs="+",
+        help=".npy files of candidates, .npz archives of them or directories",
+    )
+    parser.add_argument("--output", required=True, help="output directory")
+    parser.add_argument("--s", type=int, required=True)
+    parser.add_argument(
+        "--criterion", choices=sensor.dispatch.CRITERIA, default="entropy"
+    )
+    parser.add_argument(
+        "--backend",
+        choices=sensor.dispatch.BACKENDS,
+        help="the predicted fastest available by default",
+    )
+    parser.add_argument("--kernel", choices=KERNELS, default="matern52")
+    parser.add_argument("--length-scale", type=float, default=1)
+    parser.add_argument("--variance", type=float, default=1)
+    parser.add_argument(
+        "--prefetch",
+        type=int,
+        default=2,
+        help="candidate sets loaded ahead of the one being placed",
+    )
+    parser.add_argument("--quiet", action="store_true")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+
+    kernel = KERNELS[args.kernel](args.length_scale)
+    if args.variance != 1:
+        kernel = kernels.ConstantKernel(args.variance) * kernel
+
+    start = time.perf_counter()
+    placed, failed, waited = 0, 0, 0.0
+    for name, future in prefetch(jobs(args.inputs), args.prefetch):
+        try:
+            begin = time.perf_counter()
+            X = future.result()
+            # time not overlapped with placing the previous candidate set
+            waited += time.perf_counter() - begin
+            begin = time.perf_counter()
+            indexes, variances = place(X, kernel, args)
+            elapsed = time.perf_counter() - begin
+        except (OSError, ValueError, np.linalg.LinAlgError) as error:
+            failed += 1
+            print(f"{name}: failed ({error})", file=sys.stderr)
+            continue
+        path = os.path.join(args.output, f"{name}.npz")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        np.savez(path, indexes=indexes, variances=variances)
+        placed += 1
+        if not args.quiet:
+            print(f"{name}: n={len(X)} s={len(indexes)} {elapsed:.3e} s")
+
+    elapsed = time.perf_counter() - start
+    print(
+        f"{placed} placed, {failed} failed in {elapsed:.3f} s"
+        f" ({placed / elapsed:.2f} problems/s, {waited:.3f} s waiting on io)"
+    )
+    if failed > 0:
+        sys.exit(1)
@@ -1,19 +1,55 @@
+from .checkpoint import Checkpoint
+from .dispatch import calibrate, select
+from .parallel import select_many
+from .partition import select_partitioned
+from .profiling import Profiler
+from .selector import EntropySelector, MISelector
 from .sensor import (
+    conditional_variances,
+    entropy_batch,
     entropy_chol,
+    entropy_mmap,
     entropy_naive,
+    entropy_objective,
     entropy_prec,
     entropy_prechol,
+    entropy_sparse,
+    entropy_stream,
     mi_chol,
+    mi_lazy,
+    mi_local,
+    mi_lowrank,
     mi_naive,
+    mi_objective,
     mi_prec,
+    mi_sparse,
 )
 
 __all__ = [
+    "Checkpoint",
+    "EntropySelector",
+    "MISelector",
+    "Profiler",
+    "calibrate",
+    "conditional_variances",
+    "entropy_batch",
     "entropy_chol",
+    "entropy_mmap",
     "entropy_naive",
+    "entropy_objective",
     "entropy_prec",
     "entropy_prechol",
+    "entropy_sparse",
+    "entropy_stream",
     "mi_chol",
+    "mi_lazy",
+    "mi_local",
+    "mi_lowrank",
     "mi_naive",
+    "mi_objective",
     "mi_prec",
+    "mi_sparse",
+    "select",
+    "select_many",
+    "select_partitioned",
 ]
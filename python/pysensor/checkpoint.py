@@ -0,0 +1,110 @@
+import hashlib
+import os
+import time
+
+import numpy as np
+
+
+def fingerprint(criterion: str, X: np.ndarray, kernel, *indexes) -> str:
+    """Hash of a selection problem, so a save is only resumed by its own."""
+    h = hashlib.sha256(criterion.encode())
+    h.update(np.ascontiguousarray(X, dtype=np.float64).tobytes())
+    h.update(str(X.shape).encode())
+    # the repr rounds hyperparameters, so hash their values exactly
+    h.update(type(kernel).__name__.encode())
+    for key, value in sorted(kernel.get_params().items()):
+        h.update(key.encode())
+        if isinstance(value, (float, int, np.ndarray)):
+            h.update(np.asarray(value, dtype=np.float64).tobytes())
+        else:
+            h.update(repr(value).encode())
+    for index in indexes:
+        h.update(np.asarray(index, dtype=np.int64).tobytes())
+        h.update(b";")
+    return h.hexdigest()
+
+
+class Checkpoint:
+    """Saves the progress of a greedy selection to a directory."""
+
+    def __init__(
+        self,
+        directory: str,
+        every: int | None = None,
+        seconds: float | None = 600,
+    ) -> None:
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        # save after every many selections or seconds, whichever comes first
+        self.every, self.seconds = every, seconds
+        self.last, self.start = 0, time.monotonic()
+
+    def path(self, name: str) -> str:
+        """File of an array in the directory."""
+        return os.path.join(self.directory, f"{name}.npy")
+
+    def restore(
+        self, shape: tuple[int, int], key: str
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Memory-mapped factor and the indexes selected before it was saved."""
+        # the clock for the time between saves starts with the run
+        self.last, self.start = 0, time.monotonic()
+        path, indexes = self.path("L"), np.zeros(0, dtype=np.int64)
+        if (
+            os.path.exists(path)
+            and os.path.exists(self.path("indexes"))
+            and self.key() == key
+        ):
+            L = np.load(path, mmap_mode="r+")
+            if L.shape == shape:
+                indexes = np.load(self.path("indexes"))
+                self.last = len(indexes)
+                return L, indexes
+        # a save of another problem is discarded, its indexes first so a
+        # crash never pairs them with the new fingerprint
+        if os.path.exists(self.path("indexes")):
+            os.remove(self.path("indexes"))
+        # column-major, so a flush only writes the new columns
+        L = np.lib.format.open_memmap(
+            path, mode="w+", shape=shape, fortran_order=True
+        )
+        self.replace("key", np.array(key))
+        return L, indexes
+
+    def key(self) -> str | None:
+        """Fingerprint of the problem saved in the directory, if any."""
+        if not os.path.exists(self.path("key")):
+            return None
+        return str(np.load(self.path("key")))
+
+    def step(self, L: np.ndarray, indexes: np.ndarray) -> None:
+        """Save if enough selections or time have passed since the last."""
+        now = time.monotonic()
+        if (
+            self.every is not None and len(indexes) - self.last >= self.every
+        ) or (self.seconds is not None and now - self.start >= self.seconds):
+            self.save(L, indexes)
+
+    def save(self, L: np.ndarray, indexes: np.ndarray) -> None:
+        """Flush the factor, then atomically replace the selected indexes."""
+        # the factor only grows columns, so until the indexes are replaced
+        # the last save is still consistent
+        if isinstance(L, np.memmap):
+            L.flush()
+        self.replace("indexes", indexes)
+        self.last, self.start = len(indexes), time.monotonic()
+
+    def replace(self, name: str, array: np.ndarray) -> None:
+        """Atomically replace an array, durable once this returns."""
+        temp = self.path(f"{name}.tmp")
+        with open(temp, "wb") as f:
+            np.save(f, array)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp, self.path(name))
+        # the rename itself is only durable once the directory is synced
+        fd = os.open(self.directory, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
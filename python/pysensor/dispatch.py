@@ -0,0 +1,308 @@
+import sys
+import time
+from collections.abc import Callable
+from functools import partial
+
+import numpy as np
+
+# backends in order of preference when their predicted costs tie
+BACKENDS = ["cython", "python", "jax"]
+CRITERIA = ["entropy", "mi"]
+
+# seconds per unit of each of the terms(), fit by calibrate() on one core
+# with a Matern kernel, importing jax, flax and gpjax takes about 3 s
+COSTS: dict[str, dict[str, list[float]]] = {
+    "entropy": {
+        "python": [1.1e-3, 2.5e-9, 1.2e-9, 0, 0, 0, 0],
+        "cython": [1.2e-4, 1.6e-9, 1.7e-10, 0, 0, 0, 0],
+        "jax": [1.2e-3, 6.4e-9, 4.0e-10, 0, 0, 0.27, 3],
+    },
+    "mi": {
+        "python": [7.4e-3, 8.3e-9, 0, 2.5e-11, 6.1e-10, 0, 0],
+        "cython": [2.2e-3, 1.4e-7, 9.1e-10, 2.4e-11, 1.3e-9, 0, 0],
+        "jax": [1.3e-2, 0, 0, 1.0e-10, 3.3e-10, 0.58, 3],
+    },
+}
+
+# (criterion, n bucket, s bucket, d) compiled by jax in this process
+_compiled: set[tuple] = set()
+# backends that failed to import
+_missing: set[str] = set()
+
+Method = Callable[..., np.ndarray]
+
+
+def terms(
+    criterion: str,
+    n: int,
+    s: int,
+    d: int,
+    compile: bool = False,
+    load: bool = False,
+) -> np.ndarray:
+    """Features of the cost model, the time is their weighted sum."""
+    # overhead, kernel evaluations and factor updates, for MI the precision
+    # factor and its downdates, then compiling and importing the backend
+    mi = criterion == "mi"
+    return np.array(
+        [1, n * s * d, n * s * s, mi * n**3, mi * s * n * n, compile, load],
+        dtype=np.float64,
+    )
+
+
+def cold(backend: str, criterion: str, n: int, s: int, d: int) -> tuple:
+    """Whether backend has to compile and import before selecting."""
+    if backend != "jax":
+        return False, False
+    jaxsensor = sys.modules.get("jaxsensor")
+    if jaxsensor is None:
+        return True, True
+    return _shape(jaxsensor, criterion, n, s, d) not in _compiled, False
+
+
+def _shape(jaxsensor, criterion: str, n: int, s: int, d: int) -> tuple:
+    """Key of the program jaxsensor compiles for a problem."""
+    bucket = jaxsensor.bucket
+    return (criterion, bucket(n), min(bucket(min(s, n)), bucket(n)), d)
+
+
+def predict(
+    backend: str,
+    criterion: str,
+    n: int,
+    s: int,
+    d: int,
+    costs: dict | None = None,
+) -> float:
+    """Predicted seconds for backend to select s of n points in d dims."""
+    costs = COSTS if costs is None else costs
+    if backend in _missing:
+        return np.inf
+    features = terms(criterion, n, s, d, *cold(backend, criterion, n, s, d))
+    return float(np.dot(costs[criterion][backend], features))
+
+
+def sklearn_kernel(kernel):
+    """The kernel as an sklearn kernel, translating from gpjax."""
+    if type(kernel).__module__.startswith("sklearn"):
+        return kernel
+    from flax import nnx
+    from sklearn.gaussian_process import kernels
+
+    # split kernels are a graph definition and its state
+    if isinstance(kernel, tuple):
+        kernel = nnx.merge(*kernel)
+    length_scale = np.asarray(kernel.lengthscale.value, dtype=np.float64)
+    length_scale = (
+        length_scale if length_scale.ndim > 0 else float(length_scale)
+    )
+    match type(kernel).__name__:
+        case "Matern12":
+            base = kernels.Matern(length_scale=length_scale, nu=1 / 2)
+        case "Matern32":
+            base = kernels.Matern(length_scale=length_scale, nu=3 / 2)
+        case "Matern52":
+            base = kernels.Matern(length_scale=length_scale, nu=5 / 2)
+        case "RBF":
+            base = kernels.RBF(length_scale=length_scale)
+        case "RationalQuadratic":
+            alpha = float(kernel.alpha.value)
+            base = kernels.RationalQuadratic(length_scale, alpha)
+        case _:
+            raise ValueError(f"Can't translate {kernel} to sklearn")
+    variance = float(kernel.variance.value)
+    return base if variance == 1 else kernels.ConstantKernel(variance) * base
+
+
+def jax_kernel(kernel) -> tuple:
+    """The kernel as a split gpjax kernel, translating from sklearn."""
+    from flax import nnx
+
+    if isinstance(kernel, tuple):
+        return kernel
+    if not type(kernel).__module__.startswith("sklearn"):
+        return nnx.split(kernel)
+    from gpjax import kernels as jaxkernels
+    from sklearn.gaussian_process import kernels
+
+    # a constant factor on either side is the variance
+    variance = 1.0
+    if isinstance(kernel, kernels.Product):
+        for scale, base in [(kernel.k1, kernel.k2), (kernel.k2, kernel.k1)]:
+            if isinstance(scale, kernels.ConstantKernel):
+                variance, kernel = scale.constant_value, base
+                break
+    lengthscale = getattr(kernel, "length_scale", None)
+    # Matern subclasses RBF, so it's matched first
+    match kernel:
+        case kernels.Matern(nu=0.5):
+            jaxkernel = jaxkernels.Matern12
+        case kernels.Matern(nu=1.5):
+            jaxkernel = jaxkernels.Matern32
+        case kernels.Matern(nu=2.5):
+            jaxkernel = jaxkernels.Matern52
+        case kernels.Matern(nu=np.inf) | kernels.RBF():
+            jaxkernel = jaxkernels.RBF
+        case kernels.RationalQuadratic():
+            jaxkernel = partial(
+                jaxkernels.RationalQuadratic, alpha=kernel.alpha
+            )
+        case _:
+            raise ValueError(f"Can't translate {kernel} to gpjax")
+    return nnx.split(jaxkernel(lengthscale=lengthscale, variance=variance))
+
+
+def _jax_method(criterion: str) -> Method:
+    """Bucketed jaxsensor selection returning a NumPy array."""
+    import jax
+
+    import jaxsensor
+
+    # selections match the other backends in float64
+    jax.config.update("jax_enable_x64", True)
+    f = getattr(jaxsensor, f"{criterion}_bucketed")
+
+    def select(X: np.ndarray, kernel: tuple, s: int, *_) -> np.ndarray:
+        """Select s points from X, remembering the compiled shape."""
+        n, d = X.shape
+        indexes = np.asarray(f(X, kernel, s))
+        _compiled.add(_shape(jaxsensor, criterion, n, s, d))
+        return indexes
+
+    return select
+
+
+def _python_mi(
+    X: np.ndarray,
+    kernel,
+    s: int,
+    fixed: np.ndarray | None = None,
+    forbidden: np.ndarray | None = None,
+) -> np.ndarray:
+    """MI by the precision, falling back to mi_chol for fixed or forbidden."""
+    from . import sensor
+
+    # mi_prec downdates the whole precision, faster without conditioning
+    if fixed is None and forbidden is None:
+        return sensor.mi_prec(X, kernel, s)
+    return sensor.mi_chol(X, kernel, s, fixed, forbidden)
+
+
+def method(backend: str, criterion: str) -> tuple[Method, Callable]:
+    """Selection method of a backend and its kernel translation."""
+    # backends are only imported when they are first used
+    try:
+        match backend:
+            case "python":
+                from . import sensor
+
+                if criterion == "mi":
+                    return _python_mi, sklearn_kernel
+                f = getattr(sensor, f"{criterion}_chol")
+                return f, sklearn_kernel
+            case "cython":
+                import cysensor
+
+                f = getattr(cysensor, f"{criterion}_chol")
+                return f, sklearn_kernel
+            case "jax":
+                return _jax_method(criterion), jax_kernel
+            case _:
+                raise ValueError(f"Unknown backend {backend}")
+    except ImportError:
+        _missing.add(backend)
+        raise
+
+
+def select(
+    X: np.ndarray,
+    kernel,
+    s: int,
+    criterion: str = "entropy",
+    backend: str | None = None,
+    fixed: np.ndarray | None = None,
+    forbidden: np.ndarray | None = None,
+    costs: dict | None = None,
+) -> np.ndarray:
+    """Greedily select s points from X by criterion on the fastest backend."""
+    if criterion not in CRITERIA:
+        raise ValueError(f"Unknown criterion {criterion}")
+    X = np.ascontiguousarray(X, dtype=np.float64)
+    n, d = X.shape
+    backends = BACKENDS if backend is None else [backend]
+    errors = []
+    # only the Cholesky methods condition on fixed and forbidden points
+    if (fixed is not None or forbidden is not None) and "jax" in backends:
+        errors.append("jax: fixed/forbidden unsupported")
+        backends = [name for name in backends if name != "jax"]
+    # stable, so ties keep the order of preference
+    ranked = sorted(
+        backends, key=lambda name: predict(name, criterion, n, s, d, costs)
+    )
+    for name in ranked:
+        try:
+            f, translate = method(name, criterion)
+            translated = translate(kernel)
+        except (ImportError, ValueError) as error:
+            errors.append(f"{name}: {error}")
+            continue
+        return f(X, translated, s, fixed, forbidden)
+    raise ValueError(f"No backend can select: {'; '.join(errors)}")
+
+
+def calibrate(
+    kernel,
+    grid: list[tuple[int, int, int]] | None = None,
+    repeat: int = 3,
+    backends: list[str] | None = None,
+) -> dict[str, dict[str, list[float]]]:
+    """Fit the cost model to timings of the backends on this machine."""
+    from scipy.optimize import nnls
+
+    if grid is None:
+        grid = [
+            (n, s, d)
+            for n in (500, 1000, 2000)
+            for s in (20, 50)
+            for d in (2, 4)
+        ]
+    rng = np.random.default_rng(1)
+    costs = {
+        criterion: {name: list(c) for name, c in models.items()}
+        for criterion, models in COSTS.items()
+    }
+    for criterion in CRITERIA:
+        for name in BACKENDS if backends is None else backends:
+            try:
+                f, translate = method(name, criterion)
+            except ImportError:
+                continue
+            translated = translate(kernel)
+            features, times, compiles = [], [], []
+            for n, s, d in grid:
+                X = rng.random((n, d))
+                start = time.perf_counter()
+                f(X, translated, s)
+                first = time.perf_counter() - start
+                best = np.inf
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    f(X, translated, s)
+                    best = min(best, time.perf_counter() - start)
+                features.append(terms(criterion, n, s, d)[:5])
+                times.append(best)
+                compiles.append(first - best)
+            # relative error, so small problems count as much as large ones
+            times = np.array(times)
+            coef, _ = nnls(
+                np.array(features) / times[:, None], np.ones_like(times)
+            )
+            compile = (
+                max(float(np.median(compiles)), 0) if name == "jax" else 0
+            )
+            costs[criterion][name] = [
+                *map(float, coef),
+                compile,
+                costs[criterion][name][6],
+            ]
+    return costs
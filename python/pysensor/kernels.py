@@ -0,0 +1,62 @@
+import numpy as np
+from scipy.spatial.distance import cdist, pdist, squareform
+from sklearn.gaussian_process.kernels import RBF, _check_length_scale
+
+
+class Wendland(RBF):
+    """Compactly supported Wendland kernel, zero past the length scale."""
+
+    # phi_{3,1}(r) = (1 - r)_+^4 (4 r + 1), positive definite for d <= 3
+
+    def __call__(self, X, Y=None, eval_gradient=False):
+        """Kernel k(X, Y) and optionally its gradient in log length scale."""
+        X = np.atleast_2d(X)
+        length_scale = _check_length_scale(X, self.length_scale)
+        if Y is None:
+            r = squareform(pdist(X / length_scale))
+        else:
+            if eval_gradient:
+                raise ValueError("Gradient can only be evaluated when Y=None")
+            r = cdist(X / length_scale, Y / length_scale)
+        t = np.maximum(1 - r, 0)
+        K = t**4 * (4 * r + 1)
+        if not eval_gradient:
+            return K
+        if self.hyperparameter_length_scale.fixed:
+            return K, np.empty((X.shape[0], X.shape[0], 0))
+        # dk/dr = -20 r (1 - r)^3 and d r^2/d log l_i = -2 D_i^2
+        if not self.anisotropic or length_scale.shape[0] == 1:
+            return K, (20 * r**2 * t**3)[:, :, np.newaxis]
+        D = (X[:, np.newaxis, :] - X[np.newaxis, :, :]) / length_scale
+        return K, 20 * (t**3)[:, :, np.newaxis] * D**2
+
+    @property
+    def support(self) -> float:
+        """Distance past which the kernel is zero."""
+        return float(np.max(self.length_scale))
+
+    def __repr__(self) -> str:
+        if self.anisotropic:
+            length_scale = ", ".join(f"{l:.3g}" for l in self.length_scale)
+            return f"{type(self).__name__}(length_scale=[{length_scale}])"
+        length_scale = np.ravel(self.length_scale)[0]
+        return f"{type(self).__name__}(length_scale={length_scale:.3g})"
+
+
+def support(kernel) -> float:
+    """Distance past which the kernel is zero, infinite if never."""
+    # a product is zero where either factor is, a sum where both are
+    match type(kernel).__name__:
+        case "Product":
+            return min(support(kernel.k1), support(kernel.k2))
+        case "Sum":
+            return max(support(kernel.k1), support(kernel.k2))
+        case "Exponentiation":
+            return support(kernel.kernel)
+        case "WhiteKernel":
+            # noise is only on the diagonal
+            return 0.0
+        case "ConstantKernel":
+            # never zero unless it is zero, so a scaled kernel keeps its own
+            return 0.0 if kernel.constant_value == 0 else np.inf
+    return getattr(kernel, "support", np.inf)
@@ -0,0 +1,94 @@
+import multiprocessing as mp
+import os
+from collections.abc import Iterator
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+from .dispatch import select
+
+# state of a worker process, set once by _init
+_worker: dict = {}
+
+
+def _init(
+    name: str,
+    kernel,
+    criterion: str,
+    backend: str | None,
+    threads: int,
+) -> None:
+    """Attach to the shared candidates and limit the BLAS threads."""
+    from threadpoolctl import threadpool_limits
+
+    # spawned workers share the parent's resource tracker, which unlinks
+    # the block once when the parent does
+    shm = SharedMemory(name)
+    # covers OpenBLAS, MKL and the OpenMP runtime of cysensor
+    _worker["limits"] = threadpool_limits(threads)
+    _worker.update(
+        shm=shm,
+        buffer=np.ndarray(shm.size // 8, dtype=np.float64, buffer=shm.buf),
+        kernel=kernel,
+        criterion=criterion,
+        backend=backend,
+    )
+
+
+def _run(task: tuple[int, int, int, int, int]) -> tuple[int, np.ndarray]:
+    """Select from the ith problem, a view into the shared block."""
+    i, start, n, d, s = task
+    X = _worker["buffer"][start : start + n * d].reshape(n, d)
+    indexes = select(
+        X,
+        _worker["kernel"],
+        s,
+        criterion=_worker["criterion"],
+        backend=_worker["backend"],
+    )
+    return i, indexes
+
+
+def select_many(
+    problems: list[np.ndarray],
+    kernel,
+    s: int | list[int],
+    criterion: str = "entropy",
+    backend: str | None = None,
+    workers: int | None = None,
+    threads: int = 1,
+) -> Iterator[tuple[int, np.ndarray]]:
+    """Select s points from each problem on a process pool as completed."""
+    workers = (os.cpu_count() or 1) if workers is None else workers
+    # s is either shared or given for each problem
+    budgets = np.broadcast_to(s, len(problems))
+    shapes = [np.shape(X) for X in problems]
+    starts = np.cumsum([0] + [n * d for n, d in shapes])
+    # one block for every problem, so each is a zero-copy view in workers
+    shm = SharedMemory(create=True, size=max(8 * int(starts[-1]), 8))
+    buffer = np.ndarray(shm.size // 8, dtype=np.float64, buffer=shm.buf)
+    try:
+        for X, start, (n, d) in zip(problems, starts, shapes):
+            buffer[start : start + n * d] = np.ravel(X)
+        # largest first, so a big problem never starts last and runs alone
+        tasks = sorted(
+            (
+                (i, int(start), n, d, int(budget))
+                for i, (start, (n, d), budget) in enumerate(
+                    zip(starts, shapes, budgets)
+                )
+            ),
+            key=lambda task: (-task[2], -task[3]),
+        )
+        # spawned, since OpenMP and jax runtimes are not fork-safe
+        context = mp.get_context("spawn")
+        with context.Pool(
+            workers,
+            initializer=_init,
+            initargs=(shm.name, kernel, criterion, backend, threads),
+        ) as pool:
+            yield from pool.imap_unordered(_run, tasks)
+    finally:
+        del buffer
+        shm.close()
+        shm.unlink()
@@ -0,0 +1,102 @@
+import numpy as np
+
+from .dispatch import select
+from .parallel import select_many
+
+
+def tiles(
+    X: np.ndarray, shape: int | tuple[int, ...], overlap: float = 0.25
+) -> list[tuple[np.ndarray, np.ndarray]]:
+    """Points owned by each cell of a grid over X and those in its halo."""
+    # O(n t) for t tiles, the halo extends overlap cell widths past a cell
+    shape = tuple(np.broadcast_to(shape, X.shape[1]))
+    lo, hi = X.min(axis=0), X.max(axis=0)
+    width = (hi - lo) / shape
+    # a dimension without extent has every point in its first cell
+    width[width == 0] = 1
+    cells = np.minimum(
+        ((X - lo) / width).astype(np.int64), np.subtract(shape, 1)
+    )
+    owner = np.ravel_multi_index(tuple(cells.T), shape)
+    order = np.argsort(owner, kind="stable")
+    bounds = np.searchsorted(owner[order], np.arange(np.prod(shape) + 1))
+    parts = []
+    for tile, cell in enumerate(np.ndindex(*shape)):
+        core = order[bounds[tile] : bounds[tile + 1]]
+        start = lo + np.multiply(cell, width)
+        halo = overlap * width
+        near = np.all(
+            (X >= start - halo) & (X <= start + width + halo), axis=1
+        )
+        near[core] = False
+        parts.append((core, np.flatnonzero(near)))
+    return parts
+
+
+def select_partitioned(
+    X: np.ndarray,
+    kernel,
+    s: int,
+    criterion: str = "entropy",
+    shape: int | tuple[int, ...] = 4,
+    overlap: float = 0.25,
+    oversample: float = 2,
+    context: int = 2000,
+    workers: int = 1,
+    seed: int = 1,
+) -> np.ndarray:
+    """Greedy selection on overlapping tiles reconciled by a global greedy."""
+    # O(t (n/t) (r/t)^2 + r s^2) for entropy on t tiles with r = s*oversample
+    X = np.ascontiguousarray(X, dtype=np.float64)
+    n = len(X)
+    s = min(s, n)
+    parts = [
+        (core, near) for core, near in tiles(X, shape, overlap) if len(core)
+    ]
+    # entropy only depends on the selected points, so a halo would just
+    # steal picks from the points a tile owns. For MI the halo points are
+    # unselected neighbors, and competing with them keeps a tile from
+    # crowding its boundary, so MI tiles select on core and halo and keep
+    # the winners they own
+    problems = [
+        core if criterion == "entropy" else np.concatenate((core, near))
+        for core, near in parts
+    ]
+    budgets = [
+        min(len(core), int(np.ceil(oversample * s * len(core) / n)))
+        for core, _ in parts
+    ]
+    if workers == 1:
+        results = enumerate(
+            select(X[problem], kernel, budget, criterion)
+            for problem, budget in zip(problems, budgets)
+        )
+    else:
+        results = select_many(
+            [X[problem] for problem in problems],
+            kernel,
+            budgets,
+            criterion,
+            workers=workers,
+        )
+    winners = np.sort(
+        np.concatenate(
+            [
+                problems[i][indexes[indexes < len(parts[i][0])]]
+                for i, indexes in results
+            ]
+        )
+    )
+    # MI is also over the unselected points, the halos along tile
+    # boundaries stand in for the points the tiles disagree about
+    points, forbidden = winners, None
+    if criterion == "mi":
+        halos = np.setdiff1d(
+            np.concatenate([near for _, near in parts]), winners
+        )
+        rng = np.random.default_rng(seed)
+        halos = rng.choice(halos, min(context, len(halos)), replace=False)
+        points = np.concatenate((winners, halos))
+        forbidden = np.arange(len(winners), len(points))
+    indexes = select(X[points], kernel, s, criterion, forbidden=forbidden)
+    return points[indexes]
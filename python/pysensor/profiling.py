@@ -0,0 +1,195 @@
+import json
+import time
+from collections.abc import Callable
+from typing import Self
+
+import numpy as np
+
+# profilers collecting events, innermost last
+_profilers: list["Profiler"] = []
+
+
+def costs(
+    phase: str, n: int, d: int, i: int, k: int = 0
+) -> tuple[float, float]:
+    """Model flops and bytes of a phase on the ith selection of point k."""
+    # counts are of the algorithm, not any particular implementation
+    match phase:
+        case "argmax":
+            return n, 8 * n
+        case "kernel":
+            return (3 * d + 10) * n, 8 * (n * d + n)
+        case "update":
+            # left looking gemv and scaling
+            return 2 * n * i + n, 8 * (n * i + 2 * n)
+        case "variance":
+            return 2 * n, 24 * n
+        case "downdate":
+            # precision column by gemv, then the rank-one downdate
+            area = n * k - k * k / 2
+            return 2 * n * (k + 1) + k * k + 6 * area, 8 * n * (k + 1)
+        case "prec variance":
+            return n * n, 4 * n * n
+        case _:
+            return 0, 0
+
+
+class Profiler:
+    """Collects the time, flops and bytes of each phase of selection."""
+
+    def __init__(
+        self,
+        callback: Callable[[dict], None] | None = None,
+        jax_trace: str | None = None,
+    ) -> None:
+        self.events: list[dict] = []
+        self.callback = callback
+        # directory for JAX's own trace, which sees inside compiled code
+        self.jax_trace = jax_trace
+
+    def __enter__(self) -> Self:
+        _profilers.append(self)
+        if self.jax_trace is not None:
+            import jax
+
+            jax.profiler.start_trace(
+                self.jax_trace, create_perfetto_trace=True
+            )
+        return self
+
+    def __exit__(self, *args) -> None:
+        if self.jax_trace is not None:
+            import jax
+
+            jax.profiler.stop_trace()
+        _profilers.remove(self)
+
+    def record(self, event: dict) -> None:
+        """Add an event with method, phase, iteration, start and end."""
+        self.events.append(event)
+        if self.callback is not None:
+            self.callback(event)
+
+    def summary(self) -> str:
+        """Table of the time and throughput of each phase."""
+        totals: dict[tuple[str, str], list[float]] = {}
+        for event in self.events:
+            total = totals.setdefault(
+                (event["method"], event["phase"]), [0, 0, 0, 0]
+            )
+            total[0] += 1
+            total[1] += event["end"] - event["start"]
+            total[2] += event["flops"]
+            total[3] += event["bytes"]
+        elapsed: dict[str, float] = {}
+        for (method, _), total in totals.items():
+            elapsed[method] = elapsed.get(method, 0) + total[1]
+        lines = [
+            (
+                f"{'method':<20} {'phase':<14} {'calls':>6} {'time (s)':>10}"
+                f" {'share':>6} {'GFLOP/s':>8} {'GB/s':>8}"
+            )
+        ]
+        for (method, phase), (calls, seconds, flops, nbytes) in sorted(
+            totals.items(), key=lambda item: (item[0][0], -item[1][1])
+        ):
+            seconds = max(seconds, 1e-12)
+            lines.append(
+                f"{method:<20} {phase:<14} {calls:6} {seconds:10.3e}"
+                f" {100 * seconds / elapsed[method]:5.1f}%"
+                f" {flops / seconds / 1e9:8.3f} {nbytes / seconds / 1e9:8.3f}"
+            )
+        return "\n".join(lines)
+
+    def save(self, path: str) -> None:
+        """Write the events in the Chrome trace event format."""
+        origin = min((event["start"] for event in self.events), default=0)
+        threads = {method: i for i, method in enumerate(self.methods())}
+        trace = [
+            {
+                "name": event["phase"],
+                "cat": event["method"],
+                "ph": "X",
+                # microseconds since the first event
+                "ts": 1e6 * (event["start"] - origin),
+                "dur": 1e6 * (event["end"] - event["start"]),
+                "pid": 0,
+                "tid": threads[event["method"]],
+                "args": {
+                    "iteration": event["iteration"],
+                    "flops": event["flops"],
+                    "bytes": event["bytes"],
+                },
+            }
+            for event in self.events
+        ]
+        # name the rows of the trace after the methods
+        trace += [
+            {
+                "name": "thread_name",
+                "ph": "M",
+                "pid": 0,
+                "tid": tid,
+                "args": {"name": method},
+            }
+            for method, tid in threads.items()
+        ]
+        with open(path, "w") as f:
+            json.dump({"traceEvents": trace}, f)
+
+    def methods(self) -> list[str]:
+        """Methods with events in order of first appearance."""
+        return list(dict.fromkeys(event["method"] for event in self.events))
+
+
+class Clock:
+    """Times consecutive phases of one call for the active profilers."""
+
+    def __init__(self, method: str, n: int, d: int) -> None:
+        self.method, self.n, self.d = method, n, d
+        self.last = time.perf_counter()
+
+    def mark(self, phase: str, iteration: int, k: int = 0) -> None:
+        """End the phase started at the previous mark."""
+        end = time.perf_counter()
+        self.record(phase, iteration, k, self.last, end)
+        self.last = end
+
+    def record(
+        self, phase: str, iteration: int, k: int, start: float, end: float
+    ) -> None:
+        """Send a phase to every active profiler."""
+        flops, nbytes = costs(phase, self.n, self.d, iteration, k)
+        # plain Python numbers so events serialize to JSON
+        event = {
+            "method": self.method,
+            "phase": phase,
+            "iteration": int(iteration),
+            "start": float(start),
+            "end": float(end),
+            "flops": float(flops),
+            "bytes": float(nbytes),
+        }
+        for profiler in _profilers:
+            profiler.record(event)
+
+    def replay(
+        self,
+        phases: list[str],
+        marks: np.ndarray,
+        indexes: np.ndarray,
+        offset: int = 0,
+    ) -> None:
+        """Record phases from timestamps taken by compiled code."""
+        # marks[i, 0] starts the ith iteration and marks[i, p + 1] ends
+        # phase p, with offset the number of columns before the first
+        for i, k in enumerate(indexes):
+            for p, phase in enumerate(phases):
+                start, end = marks[i, p], marks[i, p + 1]
+                self.record(phase, offset + i, int(k), start, end)
+
+
+def clock(method: str, n: int, d: int) -> Clock | None:
+    """Clock for a call of method if profiling, otherwise None."""
+    # a single truth test per phase is the cost when disabled
+    return Clock(method, n, d) if _profilers else None
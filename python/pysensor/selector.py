@@ -0,0 +1,123 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+from .sensor import chol_downdate, gram, prec_chol
+
+if TYPE_CHECKING:
+    from sklearn.gaussian_process.kernels import Kernel
+
+
+def resize(m: np.ndarray, s: int) -> np.ndarray:
+    """Copy the columns of m into a zero matrix with s columns."""
+    out = np.zeros((m.shape[0], s))
+    out[:, : m.shape[1]] = m
+    return out
+
+
+class EntropySelector:
+    """Greedy entropy selection that keeps its state between calls."""
+
+    def __init__(self, X: np.ndarray, kernel: Kernel) -> None:
+        self.X = np.asarray(X)
+        self.kernel = kernel
+        self.indexes = np.zeros(0, dtype=np.int64)
+        # pivots[i] is the conditional standard deviation of indexes[i]
+        self.pivots = np.zeros(0)
+        self.L = np.zeros((len(X), 0))
+        self.cond_var: np.ndarray = kernel.diag(X)  # type: ignore
+
+    def _score(self) -> np.ndarray:
+        """Objective of each point, the greedy selection is its argmax."""
+        return self.cond_var
+
+    def _select(self, i: int, k: int) -> None:
+        """Condition on the kth point as the ith selection."""
+        X, L = self.X, self.L
+        self.indexes[i] = k
+        # update Cholesky factor by left looking
+        L[:, i] = self.kernel(X, X[k : k + 1]).flatten()  # type: ignore
+        L[:, i] -= L[:, :i] @ L[k, :i]
+        self.pivots[i] = np.sqrt(L[k, i])
+        L[:, i] /= self.pivots[i]
+        # update conditional variance
+        self.cond_var -= L[:, i] ** 2
+        self.cond_var[k] = -1
+
+    def extend(self, ds: int) -> np.ndarray:
+        """Select ds more points and return every selected index."""
+        # O(ds*(n*s + s^2)) for s selected after extending
+        start = len(self.indexes)
+        s = min(start + ds, len(self.X))
+        self.indexes = np.append(self.indexes, np.zeros(s - start, np.int64))
+        self.pivots = np.append(self.pivots, np.zeros(s - start))
+        self.L = resize(self.L, s)
+        for i in range(start, s):
+            self._select(i, int(np.argmax(self._score())))
+        return self.indexes.copy()
+
+    def add_candidates(self, X_new: np.ndarray) -> None:
+        """Add candidate points, conditioning them on the selected points."""
+        # O(m s^2) for m new points, past selections are kept as they are,
+        # so later selections only match a fresh run on every point if none
+        # of the new points would have been picked earlier
+        X_new = np.asarray(X_new)
+        L_new = np.zeros((len(X_new), self.L.shape[1]))
+        cond_var: np.ndarray = self.kernel.diag(X_new)  # type: ignore
+        for i, k in enumerate(self.indexes):
+            point = self.X[k : k + 1]
+            L_new[:, i] = self.kernel(X_new, point).flatten()  # type: ignore
+            L_new[:, i] -= L_new[:, :i] @ self.L[k, :i]
+            L_new[:, i] /= self.pivots[i]
+            cond_var -= L_new[:, i] ** 2
+        self.X = np.concatenate((self.X, X_new))
+        self.L = np.concatenate((self.L, L_new))
+        self.cond_var = np.concatenate((self.cond_var, cond_var))
+
+
+class MISelector(EntropySelector):
+    """Greedy mutual information selection that keeps its state."""
+
+    def __init__(self, X: np.ndarray, kernel: Kernel) -> None:
+        super().__init__(X, kernel)
+        self._factor_prec()
+
+    def _factor_prec(self) -> None:
+        """Factor the precision of every point and condition on selections."""
+        # O(n^3 + s*(n^2)), every conditional changes with new candidates
+        self.candidates = np.ones(len(self.X), dtype=bool)
+        self.L2 = prec_chol(gram(self.X[::-1], self.kernel))
+        # the full conditional of i is the ith diagonal in precision
+        self.cond_var2 = np.einsum("ij,ij->i", self.L2, self.L2)
+        for k in self.indexes:
+            self._condition_prec(k)
+
+    def _condition_prec(self, k: int) -> None:
+        """Remove the kth point from the candidates in the precision."""
+        L2, candidates = self.L2, self.candidates
+        candidates[k] = False
+        # marginalization in covariance is conditioning in precision
+        u = L2[:, : k + 1] @ L2[k, : k + 1]
+        u /= np.sqrt(u[k])
+        chol_downdate(L2, u, k)
+        # remove the selected point in-place
+        L2[k], L2[:, k] = 0, 0
+        # update conditional variance of candidates
+        self.cond_var2[candidates] = np.einsum("ij,ij->i", L2, L2)[candidates]
+
+    def _score(self) -> np.ndarray:
+        """Objective of each point, the greedy selection is its argmax."""
+        return self.cond_var * self.cond_var2
+
+    def _select(self, i: int, k: int) -> None:
+        """Condition on the kth point as the ith selection."""
+        super()._select(i, k)
+        self._condition_prec(k)
+
+    def add_candidates(self, X_new: np.ndarray) -> None:
+        """Add candidate points, conditioning them on the selected points."""
+        # O(m s^2) for the covariance and O(n^3) to refactor the precision
+        super().add_candidates(X_new)
+        self._factor_prec()
@@ -1,6 +1,20 @@
+from __future__ import annotations
+
+import heapq
+from typing import TYPE_CHECKING
+
 import numpy as np
 import scipy
-from sklearn.gaussian_process.kernels import Kernel
+from scipy.linalg import blas, lapack
+
+from . import profiling
+from .checkpoint import fingerprint
+
+# sklearn is slow to import and only the caller's kernel needs it
+if TYPE_CHECKING:
+    from sklearn.gaussian_process.kernels import Kernel
+
+    from .checkpoint import Checkpoint
 
 
 def inv(m: np.ndarray) -> np.ndarray:
@@ -10,6 +24,43 @@ def inv(m: np.ndarray) -> np.ndarray:
     # return solve(m, np.identity(m.shape[0]))
 
 
+def gram(X: np.ndarray, kernel: Kernel, block: int = 2**8) -> np.ndarray:
+    """Covariance matrix of X computed in blocks of columns."""
+    n = len(X)
+    theta = np.empty((n, n))
+    for j in range(0, n, block):
+        theta[:, j : j + block] = kernel(X, X[j : j + block])  # type: ignore
+    return theta
+
+
+def inv_lower(m: np.ndarray) -> np.ndarray:
+    """Lower triangle of the inverse of a symmetric positive definite m."""
+    # overwrites m, the transpose is Fortran-ordered for LAPACK
+    L, info = lapack.dpotrf(m.T, lower=True, clean=True, overwrite_a=True)
+    if info > 0:
+        raise np.linalg.LinAlgError("Matrix is not positive definite")
+    prec, _ = lapack.dpotri(L, lower=True, overwrite_c=True)
+    return prec
+
+
+def prec_chol(m: np.ndarray) -> np.ndarray:
+    """Lower triangular L with L L^T the reversed inverse of m in-place."""
+    # m = P C C^T P for reversal P, so m^{-1} = (P C^{-T} P) (P C^{-1} P)
+    L, info = lapack.dpotrf(m.T, lower=True, clean=True, overwrite_a=True)
+    if info > 0:
+        raise np.linalg.LinAlgError("Matrix is not positive definite")
+    lapack.dtrtri(L, lower=True, overwrite_c=True)
+    # m holds C^{-T} in row-major order, P C^{-T} P reverses its entries
+    flat = m.reshape(-1)
+    n = flat.shape[0]
+    for i in range(0, n // 2, m.shape[0]):
+        j = min(i + m.shape[0], n // 2)
+        head = flat[i:j].copy()
+        flat[i:j] = flat[n - j : n - i][::-1]
+        flat[n - j : n - i] = head[::-1]
+    return m
+
+
 def solve(A: np.ndarray, b: np.ndarray, **kwargs) -> np.ndarray:
     """Solve the system Ax = b for symmetric positive definite A."""
     return scipy.linalg.solve(A, b, assume_a="pos", **kwargs)
@@ -33,22 +84,269 @@ def dot(theta: np.ndarray, x: np.ndarray, factor: bool = True):
 
 
 def chol_downdate(
-    L: np.ndarray, u: np.ndarray, j: int | None = None
+    L: np.ndarray, u: np.ndarray, j: int | None = None, block: int = 256
 ) -> np.ndarray:
     """Computes the rank-one downdate in-place, L -> chol(L L^T - u u^T)."""
+    # u of shape (n, r) is applied as r successive rank-one downdates
+    if u.ndim > 1:
+        for v in u.T:
+            chol_downdate(L, v, j, block)
+        return L
+    n = L.shape[0]
     if j is None:
-        j = L.shape[0]
-    for i in range(j):
-        c1, c2 = L[i, i], u[i]
-        dp = np.sqrt(c1 * c1 - c2 * c2)
-        c1, c2 = c1 / dp, c2 / dp
-        L[:, i] *= c1
-        L[:, i] -= c2 * u
-        u *= 1 / c1
-        u -= c2 / c1 * L[:, i]
+        j = n
+    # p = L^{-1} u by blocked forward substitution, removed columns are zero
+    p = np.zeros(j)
+    for start in range(0, j, block):
+        end = min(start + block, j)
+        D = L[start:end, start:end].copy()
+        removed = np.diagonal(D) == 0
+        D[removed, removed] = 1
+        p[start:end] = solve_triangular(
+            D, u[start:end] - L[start:end, :start] @ p[:start]
+        )
+        p[start:end][removed] = 0
+    # L L^T - u u^T = L (I - p p^T) L^T and the Cholesky factor of I - p p^T
+    # has diagonal sqrt(t_i/t_{i-1}) and columns -p_i p/sqrt(t_{i-1} t_i)
+    # below the diagonal for t_i = 1 - p_0^2 - ... - p_i^2
+    t = 1 - np.cumsum(p * p)
+    t_prev = np.concatenate(([1], t[:-1]))
+    d, w = np.sqrt(t / t_prev), p / np.sqrt(t * t_prev)
+    for start in range(0, n, block):
+        end = min(start + block, n)
+        m = min(j, end)
+        rows = L[start:end, :m]
+        # sum of L[:, r] p_r for r > i is u minus the prefix sum up to i
+        rest = u[start:end, np.newaxis] - np.cumsum(rows * p[:m], axis=1)
+        rows[:] = np.tril(rows * d[:m] - rest * w[:m], start)
     return L
 
 
+def pivoted_chol(
+    theta: np.ndarray, k: int, bound: float = -np.inf
+) -> tuple[np.ndarray, np.ndarray]:
+    """Partial Cholesky factor of theta with k greedily chosen pivots."""
+    n = theta.shape[0]
+    pivots = np.zeros(k, dtype=np.int64)
+    L = np.zeros((n, k))
+    cond_var = np.copy(np.diagonal(theta))
+    for i in range(k):
+        j = np.argmax(cond_var)
+        # stop early once the best pivot no longer beats the bound
+        if i > 0 and cond_var[j] <= bound:
+            return pivots[:i], L[:, :i]
+        pivots[i] = j
+        L[:, i] = theta[:, j] - L[:, :i] @ L[j, :i]
+        L[:, i] /= np.sqrt(L[j, i])
+        cond_var -= L[:, i] ** 2
+        cond_var[j] = -1
+    return pivots, L
+
+
+def stream_column(
+    X: np.ndarray,
+    kernel: Kernel,
+    L: np.ndarray,
+    cond_var: np.ndarray,
+    i: int,
+    k: int,
+    tile: int,
+) -> None:
+    """Left looking update of the ith column of L by k in tiles of rows."""
+    point, row = np.asarray(X[k : k + 1]), np.array(L[k, :i])
+    pivot = np.sqrt(cond_var[k])
+    temp = np.empty(tile)
+    for start in range(0, len(X), tile):
+        rows = slice(start, start + tile)
+        # kernel, factor update and conditioning on a tile of rows at once
+        col: np.ndarray = kernel(X[rows], point)[:, 0]  # type: ignore
+        out = temp[: col.shape[0]]
+        np.matmul(L[rows, :i], row, out=out)
+        col -= out
+        col /= pivot
+        L[rows, i] = col
+        np.square(col, out=out)
+        cond_var[rows] -= out
+    cond_var[k] = -1
+
+
+def logdet(m: np.ndarray) -> float:
+    """Log determinant of a symmetric positive definite matrix m."""
+    if m.shape[0] == 0:
+        return 0
+    L = np.linalg.cholesky(m)
+    return 2 * np.sum(np.log(np.diagonal(L)))
+
+
+def local_prec(
+    X: np.ndarray, kernel: Kernel, i: int, neighbors: np.ndarray
+) -> float:
+    """Precision of the ith point conditional on the given neighbors."""
+    cov: np.ndarray = kernel(X[np.append(neighbors, i)])  # type: ignore
+    return 1 / (cov[-1, -1] - dot(cov[:-1, :-1], cov[:-1, -1]))
+
+
+def condition_fixed(
+    X: np.ndarray,
+    kernel: Kernel,
+    L: np.ndarray,
+    cond_var: np.ndarray,
+    fixed: np.ndarray,
+) -> None:
+    """Condition the first columns of L on the fixed points at once."""
+    # O(n k^2 + k^3) for k fixed points instead of k greedy steps
+    k = len(fixed)
+    if k == 0:
+        return
+    R = np.linalg.cholesky(kernel(X[fixed]))  # type: ignore
+    # L[:, :k] R^T = K[:, fixed] by one triangular solve
+    cov: np.ndarray = kernel(X, X[fixed])  # type: ignore
+    L[:, :k] = solve_triangular(R, cov.T).T
+    cond_var -= np.einsum("ij,ij->i", L[:, :k], L[:, :k])
+    cond_var[fixed] = -1
+
+
+def init_factor(
+    X: np.ndarray,
+    kernel: Kernel,
+    s: int,
+    fixed: np.ndarray,
+    forbidden: np.ndarray,
+    checkpoint: Checkpoint | None = None,
+    criterion: str = "entropy",
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Factor, conditional variance and selections resumed from a save."""
+    n, f = len(X), len(fixed)
+    cond_var: np.ndarray = kernel.diag(X)  # type: ignore
+    if checkpoint is None:
+        L, done = np.zeros((n, f + s)), np.zeros(0, dtype=np.int64)
+    else:
+        # a save of another problem is started over rather than resumed
+        key = fingerprint(criterion, X, kernel, fixed, forbidden)
+        L, done = checkpoint.restore((n, f + s), key)
+    if len(done) == 0:
+        condition_fixed(X, kernel, L, cond_var, fixed)
+    else:
+        # O(n (f + i)) for i saved selections, the columns are already done
+        m = f + len(done)
+        cond_var -= np.einsum("ij,ij->i", L[:, :m], L[:, :m])
+        cond_var[fixed], cond_var[done] = -1, -1
+    return L, cond_var, done
+
+
+def sparse_gram(
+    X: np.ndarray, kernel: Kernel, tree: scipy.spatial.KDTree, radius: float
+) -> scipy.sparse.csc_array:
+    """Covariance matrix of X for a kernel zero past radius."""
+    # O(n m) for m points within radius of a point
+    neighbors = tree.query_ball_point(X, radius, return_sorted=True)
+    cols = [
+        kernel(X[nbrs], X[j : j + 1])[:, 0]  # type: ignore
+        for j, nbrs in enumerate(neighbors)
+    ]
+    sizes = np.array(list(map(len, neighbors)), dtype=np.int64)
+    return scipy.sparse.csc_array(
+        (
+            np.concatenate(cols),
+            np.concatenate(neighbors, dtype=np.int64),
+            np.concatenate(([0], np.cumsum(sizes))),
+        ),
+        shape=(len(X), len(X)),
+    )
+
+
+def inv_diag(lu: scipy.sparse.linalg.SuperLU) -> np.ndarray:
+    """Diagonal of the inverse of a symmetric matrix from its factorization."""
+    # for A = L D L^T, Takahashi's recurrence Z = D^{-1} L^{-1} + (I - L^T) Z
+    # for Z = A^{-1} only reads the entries of Z on the sparsity of L
+    L = scipy.sparse.csc_array(scipy.sparse.tril(lu.L, k=-1))
+    L.sort_indices()
+    indptr, indices, data = L.indptr, L.indices, L.data
+    d = lu.U.diagonal()
+    n = len(d)
+    # entries of Z below the diagonal on the sparsity of L
+    Z, diag = np.zeros(len(data)), np.zeros(n)
+    rows = [indices[indptr[j] : indptr[j + 1]] for j in range(n)]
+    # position of a row within the rows S of a supernode, otherwise -1
+    pos = np.full(n, -1)
+    last = n - 1
+    while last >= 0:
+        # a supernode is a run of columns each with the rows of the next
+        first = last
+        while (
+            first > 0
+            and len(rows[first - 1]) == len(rows[first]) + 1
+            and rows[first - 1][0] == first
+            and np.array_equal(rows[first - 1][1:], rows[first])
+        ):
+            first -= 1
+        S = rows[last]
+        # Z[S, S] is in the columns S on the rows S below the diagonal
+        starts, counts = indptr[S], indptr[S + 1] - indptr[S]
+        offsets = np.repeat(starts - np.cumsum(counts) + counts, counts)
+        entries = offsets + np.arange(np.sum(counts))
+        pos[S] = np.arange(len(S))
+        r = pos[indices[entries]]
+        c = np.repeat(np.arange(len(S)), counts)
+        keep = r >= 0
+        pos[S] = -1
+        # dense Z on the supernode and S, filled from the bottom right
+        w = last - first + 1
+        block = np.zeros((w + len(S), w + len(S)))
+        block[w + r[keep], w + c[keep]] = Z[entries[keep]]
+        block[w:, w:] += block[w:, w:].T
+        block[np.arange(w, w + len(S)), np.arange(w, w + len(S))] = diag[S]
+        for j in range(last, first - 1, -1):
+            p = j - first + 1
+            l = data[indptr[j] : indptr[j + 1]]
+            z = -(block[p:, p:] @ l)
+            Z[indptr[j] : indptr[j + 1]] = z
+            diag[j] = 1 / d[j] - l @ z
+            block[p:, p - 1], block[p - 1, p:] = z, z
+            block[p - 1, p - 1] = diag[j]
+        last = first - 1
+    # the factorization is of A with its rows and columns permuted
+    return diag[lu.perm_c]
+
+
+def sparse_column(
+    X: np.ndarray,
+    kernel: Kernel,
+    tree: scipy.spatial.KDTree,
+    radius: float,
+    L: list[tuple[np.ndarray, np.ndarray]],
+    touching: dict[int, list[int]],
+    cond_var: np.ndarray,
+    k: int,
+) -> np.ndarray:
+    """Left looking update of a compressed column of L by k on its support."""
+    # O(m c) for m rows in the support and c columns with a nonzero in row k,
+    # columns of L are compressed to their rows and values
+    cols = touching.get(k, [])
+    row = [L[j][1][np.searchsorted(L[j][0], k)] for j in cols]
+    # the kernel's support around k and the fill-in of the columns on row k
+    support = np.unique(
+        np.concatenate(
+            [np.asarray(tree.query_ball_point(X[k], radius), dtype=np.int64)]
+            + [L[j][0] for j in cols]
+        )
+    )
+    col: np.ndarray = kernel(X[support], X[k : k + 1])[:, 0]  # type: ignore
+    update = np.zeros(len(support))
+    for j, l in zip(cols, row):
+        rows, vals = L[j]
+        update[np.searchsorted(support, rows)] += vals * l
+    col -= update
+    col /= np.sqrt(col[np.searchsorted(support, k)])
+    for i in support.tolist():
+        touching.setdefault(i, []).append(len(L))
+    L.append((support, col))
+    # update conditional variance on the support
+    cond_var[support] -= col**2
+    cond_var[k] = -1
+    return support
+
+
 ### Gaussian process sensor placement
 
 # see: "Near-Optimal Sensor Placements in Gaussian Processes: Theory,
@@ -148,27 +446,229 @@ def entropy_prechol(X: np.ndarray, kernel: Kernel, s: int) -> np.ndarray:
     return indexes
 
 
-def entropy_chol(X: np.ndarray, kernel: Kernel, s: int) -> np.ndarray:
+def entropy_chol(
+    X: np.ndarray,
+    kernel: Kernel,
+    s: int,
+    fixed: np.ndarray | None = None,
+    forbidden: np.ndarray | None = None,
+    dtype: np.dtype | type = np.float64,
+    checkpoint: Checkpoint | None = None,
+) -> np.ndarray:
     """Returns a list of the most entropic points in X greedily."""
     # O(s*(n*s + s^2)) = O(n s^2)
+    if np.dtype(dtype) != np.float64:
+        if checkpoint is not None:
+            raise ValueError("Only float64 factors are checkpointed")
+        return entropy_chol_mixed(X, kernel, s, fixed, forbidden, dtype)
     n = len(X)
-    s = min(s, n)
+    clock = profiling.clock("entropy_chol", n, X.shape[1])
+    fixed = np.zeros(0, dtype=np.int64) if fixed is None else fixed
+    forbidden = np.zeros(0, dtype=np.int64) if forbidden is None else forbidden
+    f = len(fixed)
+    s = min(s, n - len(np.union1d(fixed, forbidden)))
     # initialization
     indexes = np.zeros(s, dtype=np.int64)
-    L = np.zeros((n, s))
-    cond_var: np.ndarray = kernel.diag(X)  # type: ignore
+    L, cond_var, done = init_factor(X, kernel, s, fixed, forbidden, checkpoint)
+    indexes[: len(done)] = done
+    cond_var[forbidden] = -1
+    if clock:
+        clock.mark("init", -1)
 
-    for i in range(s):
+    for i in range(f + len(done), f + s):
         # pick best entry
         k = np.argmax(cond_var)
-        indexes[i] = k
+        indexes[i - f] = k
+        if clock:
+            clock.mark("argmax", i, k)
         # update Cholesky factor by left looking
         L[:, i] = kernel(X, X[k : k + 1]).flatten()  # type: ignore
+        if clock:
+            clock.mark("kernel", i, k)
         L[:, i] -= L[:, :i] @ L[k, :i]
         L[:, i] /= np.sqrt(L[k, i])
+        if clock:
+            clock.mark("update", i, k)
         # update conditional variance
         cond_var -= L[:, i] ** 2
         cond_var[k] = -1
+        if clock:
+            clock.mark("variance", i, k)
+        if checkpoint:
+            checkpoint.step(L, indexes[: i + 1 - f])
+
+    if checkpoint:
+        checkpoint.save(L, indexes)
+    return indexes
+
+
+def dot_mixed(A: np.ndarray, x: np.ndarray, block: int = 2**6) -> np.ndarray:
+    """A @ x accumulated in float64 for A stored in lower precision."""
+    # BLAS products of blocks of columns at A's precision, summed in float64
+    # so rounding grows with the block size rather than the columns of A
+    out = np.zeros(A.shape[0])
+    for j in range(0, A.shape[1], block):
+        out += A[:, j : j + block] @ x[j : j + block]
+    return out
+
+
+def entropy_chol_mixed(
+    X: np.ndarray,
+    kernel: Kernel,
+    s: int,
+    fixed: np.ndarray | None = None,
+    forbidden: np.ndarray | None = None,
+    dtype: np.dtype | type = np.float32,
+    tol: float = 1e-2,
+) -> np.ndarray:
+    """Returns a list of the most entropic points in X with a dtype factor."""
+    # O(s*(n*s + s^2)) = O(n s^2) with half the memory traffic for float32
+    n = len(X)
+    eps = np.finfo(dtype).eps
+    fixed = np.zeros(0, dtype=np.int64) if fixed is None else fixed
+    forbidden = np.zeros(0, dtype=np.int64) if forbidden is None else forbidden
+    f = len(fixed)
+    s = min(s, n - len(np.union1d(fixed, forbidden)))
+    # initialization
+    indexes = np.zeros(s, dtype=np.int64)
+    # column-major, so the product with the factor is a streaming gemv
+    L = np.zeros((n, f + s), dtype=dtype, order="F")
+    var: np.ndarray = kernel.diag(X)  # type: ignore
+    cond_var = var.astype(dtype)
+    condition_fixed(X, kernel, L, cond_var, fixed)
+    excluded = np.zeros(n, dtype=np.bool_)
+    excluded[fixed], excluded[forbidden] = True, True
+    cond_var[forbidden] = -1
+
+    for i in range(f, f + s):
+        # pick best entry
+        k = np.argmax(cond_var)
+        # update Cholesky factor by left looking, accumulating in float64
+        column: np.ndarray = kernel(X, X[k : k + 1])[:, 0]  # type: ignore
+        column -= dot_mixed(L[:, :i], L[k, :i])
+        # the pivot is a difference of terms as large as the variance with
+        # i rounding errors each, so its relative error is about i eps var
+        if column[k] < i * eps * var[k] / tol:
+            # cancellation, continue in float64 from the points so far
+            selected = indexes[: i - f]
+            return np.concatenate(
+                (
+                    selected,
+                    entropy_chol(
+                        X,
+                        kernel,
+                        s - len(selected),
+                        np.concatenate((fixed, selected)),
+                        forbidden,
+                    ),
+                )
+            )
+        indexes[i - f] = k
+        column /= np.sqrt(column[k])
+        L[:, i] = column
+        # update conditional variance, clamping rounding below zero
+        cond_var -= np.square(L[:, i])
+        excluded[k] = True
+        np.maximum(cond_var, 0, out=cond_var, where=~excluded)
+        cond_var[k] = -1
+
+    return indexes
+
+
+def entropy_batch(
+    X: np.ndarray, kernel: Kernel, s: int, b: int = 16, pool: int = 256
+) -> np.ndarray:
+    """Returns a list of the most entropic points in X greedily in batches."""
+    # O(t*(n*b*s + p^2*s)) = O(n s^2 + t p^2 s) for t batches of a pool p
+    n = len(X)
+    s = min(s, n)
+    # initialization
+    indexes = np.zeros(s, dtype=np.int64)
+    L = np.zeros((n, s))
+    cond_var: np.ndarray = kernel.diag(X)  # type: ignore
+
+    i = 0
+    while i < s:
+        # greedily pick a batch from a pool of the most entropic entries
+        p = min(max(pool, b), n - i)
+        order = np.argsort(-cond_var, kind="stable")
+        top = order[:p]
+        # variances only decrease, so no point outside the pool can beat
+        # the largest variance outside it and the batch is the exact
+        # greedy selection until the pool's best falls to that bound
+        bound = cond_var[order[p]] if p < n else -np.inf
+        cov: np.ndarray = kernel(X[top])  # type: ignore
+        cov -= L[top, :i] @ L[top, :i].T
+        pivots, factor = pivoted_chol(cov, min(b, s - i), bound)
+        m = len(pivots)
+        batch = top[pivots]
+        indexes[i : i + m] = batch
+        # update Cholesky factor by left looking with a blocked update
+        L[:, i : i + m] = kernel(X, X[batch])  # type: ignore
+        L[:, i : i + m] -= L[:, :i] @ L[batch, :i].T
+        L[:, i : i + m] = solve_triangular(factor[pivots], L[:, i : i + m].T).T
+        # update conditional variance
+        cond_var -= np.sum(L[:, i : i + m] ** 2, axis=1)
+        cond_var[batch] = -1
+        i += m
+
+    return indexes
+
+
+def entropy_stream(
+    X: np.ndarray, kernel: Kernel, s: int, tile: int = 2**11
+) -> np.ndarray:
+    """Returns a list of the most entropic points in X greedily in tiles."""
+    # O(s*(n*s + s^2)) = O(n s^2)
+    n = len(X)
+    s = min(s, n)
+    # initialization
+    indexes = np.zeros(s, dtype=np.int64)
+    L = np.zeros((n, s))
+    cond_var: np.ndarray = kernel.diag(X)  # type: ignore
+
+    for i in range(s):
+        # pick best entry
+        k = np.argmax(cond_var)
+        indexes[i] = k
+        # update Cholesky factor and conditional variance
+        stream_column(X, kernel, L, cond_var, i, k, tile)
+
+    return indexes
+
+
+def entropy_mmap(
+    X: np.ndarray,
+    kernel: Kernel,
+    s: int,
+    path: str | None = None,
+    block: int = 2**16,
+) -> np.ndarray:
+    """Returns a list of the most entropic points in X greedily out-of-core."""
+    # O(s*(n*s + s^2)) = O(n s^2) with the factor read once per iteration
+    n = len(X)
+    s = min(s, n)
+    # initialization
+    indexes = np.zeros(s, dtype=np.int64)
+    # factor is row-major so blocks of rows are contiguous on disk
+    L = (
+        np.zeros((n, s))
+        if path is None
+        else np.lib.format.open_memmap(path, mode="w+", shape=(n, s))
+    )
+    cond_var = np.concatenate(
+        [
+            kernel.diag(X[j : j + block])  # type: ignore
+            for j in range(0, n, block)
+        ]
+    )
+
+    for i in range(s):
+        # pick best entry
+        k = np.argmax(cond_var)
+        indexes[i] = k
+        # update Cholesky factor and conditional variance
+        stream_column(X, kernel, L, cond_var, i, k, block)
 
     return indexes
 
@@ -176,6 +676,36 @@ def entropy_chol(X: np.ndarray, kernel: Kernel, s: int) -> np.ndarray:
 # simple improvement to Algorithm 1 in the Krause paper
 
 
+def mi_objective(X: np.ndarray, kernel: Kernel, indexes: np.ndarray) -> float:
+    """Mutual information between selected and non-selected points."""
+    cov: np.ndarray = kernel(X)  # type: ignore
+    mask = np.zeros(len(X), dtype=np.bool_)
+    mask[indexes] = True
+    return (
+        logdet(cov[np.ix_(mask, mask)])
+        + logdet(cov[np.ix_(~mask, ~mask)])
+        - logdet(cov)
+    ) / 2
+
+
+def conditional_variances(
+    X: np.ndarray, kernel: Kernel, indexes: np.ndarray
+) -> np.ndarray:
+    """Variance of each selected point conditional on the ones before it."""
+    # O(s^3), the squared diagonal of the Cholesky factor in selection order
+    L, info = lapack.dpotrf(gram(X[indexes], kernel), lower=True)
+    if info > 0:
+        raise np.linalg.LinAlgError("Matrix is not positive definite")
+    return np.diag(L) ** 2
+
+
+def entropy_objective(
+    X: np.ndarray, kernel: Kernel, indexes: np.ndarray
+) -> float:
+    """Entropy of the selected points up to a constant."""
+    return np.sum(np.log(conditional_variances(X, kernel, indexes))) / 2
+
+
 def mi_naive(X: np.ndarray, kernel: Kernel, s: int) -> np.ndarray:
     """Max mutual information between selected and non-selected points."""
     # O(s*(s^3 + n*n^3)) = O(n^4 s)
@@ -203,10 +733,12 @@ def mi_prec(X: np.ndarray, kernel: Kernel, s: int) -> np.ndarray:
     """Max mutual information between selected and non-selected points."""
     # O(n^3 + s*(n^2)) = O(n^3)
     n = len(X)
+    s = min(s, n)
     # initialization
-    indexes, candidates = np.zeros(s, dtype=np.int64), np.arange(n)
+    indexes, candidates = np.zeros(s, dtype=np.int64), np.ones(n, dtype=bool)
     L = np.zeros((n, s))
-    prec: np.ndarray = inv(kernel(X))  # type: ignore
+    # only the lower triangle of the precision is stored and updated
+    prec = inv_lower(gram(X, kernel))
     cond_var1: np.ndarray = kernel.diag(X)  # type: ignore
     # the full conditional of i corresponds to the ith diagonal in precision
     cond_var2 = np.copy(np.diagonal(prec))
@@ -215,8 +747,7 @@ def mi_prec(X: np.ndarray, kernel: Kernel, s: int) -> np.ndarray:
         # pick best entry
         k = np.argmax(cond_var1 * cond_var2)
         indexes[i] = k
-        j = np.argwhere(candidates == k).item()
-        candidates = np.delete(candidates, j)
+        candidates[k] = False
         # update Cholesky factor
         L[:, i] = kernel(X, X[k : k + 1]).flatten()  # type: ignore
         L[:, i] -= L[:, :i] @ L[k, :i]
@@ -226,37 +757,235 @@ def mi_prec(X: np.ndarray, kernel: Kernel, s: int) -> np.ndarray:
         cond_var1[k] = -1
         # update precision of candidates
         # marginalization in covariance is conditioning in precision
-        prec -= np.outer(prec[j], prec[j]) / prec[j, j]
-        prec = np.delete(np.delete(prec, j, 0), j, 1)
+        u = np.concatenate((prec[k, :k], prec[k:, k]))
+        blas.dsyr(-1 / u[k], u, lower=True, a=prec, overwrite_a=True)
+        # remove the selected point in-place
+        prec[k, :k], prec[k:, k] = 0, 0
         # update conditional variance of candidates
-        cond_var2[candidates] = np.diagonal(prec)
+        cond_var2[candidates] = np.diagonal(prec)[candidates]
 
     return indexes
 
 
-def mi_chol(X: np.ndarray, kernel: Kernel, s: int) -> np.ndarray:
+def mi_chol(
+    X: np.ndarray,
+    kernel: Kernel,
+    s: int,
+    fixed: np.ndarray | None = None,
+    forbidden: np.ndarray | None = None,
+    checkpoint: Checkpoint | None = None,
+) -> np.ndarray:
     """Max mutual information between selected and non-selected points."""
     # O(n^3 + s*(n^2)) = O(n^3)
     n = len(X)
+    clock = profiling.clock("mi_chol", n, X.shape[1])
+    fixed = np.zeros(0, dtype=np.int64) if fixed is None else fixed
+    forbidden = np.zeros(0, dtype=np.int64) if forbidden is None else forbidden
+    f = len(fixed)
+    s = min(s, n - len(np.union1d(fixed, forbidden)))
     # initialization
-    indexes, candidates = np.zeros(s, dtype=np.int64), np.arange(n)
-    L1 = np.zeros((n, s))
-    L2: np.ndarray = np.flip(
-        solve_triangular(
-            np.linalg.cholesky(kernel(X[::-1])),  # type: ignore
-            np.identity(n),
-        )
-    ).T
+    indexes, candidates = np.zeros(s, dtype=np.int64), np.ones(n, dtype=bool)
+    L1, cond_var1, done = init_factor(
+        X, kernel, s, fixed, forbidden, checkpoint, "mi"
+    )
+    indexes[: len(done)] = done
+    # a resumed run refactors the precision without the saved selections
+    # rather than saving the dense factor of the precision
+    removed = np.concatenate((fixed, done))
+    candidates[removed] = False
+    # forbidden points stay in the complement but are never selected
+    cond_var1[forbidden] = -1
+    # fixed points are independent of the rest, removing them from precision
+    theta, reverse = gram(X[::-1], kernel), n - 1 - removed
+    theta[reverse], theta[:, reverse] = 0, 0
+    theta[reverse, reverse] = 1
+    L2 = prec_chol(theta)
+    L2[removed], L2[:, removed] = 0, 0
+    # the full conditional of i corresponds to the ith diagonal in precision
+    cond_var2 = np.einsum("ij,ij->i", L2, L2)
+    if clock:
+        clock.mark("init", -1)
+
+    for i in range(f + len(done), f + s):
+        # pick best entry
+        k = np.argmax(cond_var1 * cond_var2)
+        indexes[i - f] = k
+        candidates[k] = False
+        if clock:
+            clock.mark("argmax", i, k)
+        # update Cholesky factor
+        L1[:, i] = kernel(X, X[k : k + 1]).flatten()  # type: ignore
+        if clock:
+            clock.mark("kernel", i, k)
+        L1[:, i] -= L1[:, :i] @ L1[k, :i]
+        L1[:, i] /= np.sqrt(L1[k, i])
+        if clock:
+            clock.mark("update", i, k)
+        # update conditional variance
+        cond_var1 -= L1[:, i] ** 2
+        cond_var1[k] = -1
+        if clock:
+            clock.mark("variance", i, k)
+        # update Cholesky factor of precision of candidates
+        # marginalization in covariance is conditioning in precision
+        u = L2[:, : k + 1] @ L2[k, : k + 1]
+        u /= np.sqrt(u[k])
+        L2 = chol_downdate(L2, u, k)
+        # remove the selected point in-place
+        L2[k], L2[:, k] = 0, 0
+        if clock:
+            clock.mark("downdate", i, k)
+        # update conditional variance of candidates
+        cond_var2[candidates] = np.einsum("ij,ij->i", L2, L2)[candidates]
+        if clock:
+            clock.mark("prec variance", i, k)
+        if checkpoint:
+            checkpoint.step(L1, indexes[: i + 1 - f])
+
+    if checkpoint:
+        checkpoint.save(L1, indexes)
+    return indexes
+
+
+def mi_lazy(X: np.ndarray, kernel: Kernel, s: int) -> np.ndarray:
+    """Max mutual information between selected and non-selected points."""
+    # O(n^3 + s*(m*s^2)) for m re-evaluated candidates per iteration
+    n = len(X)
+    s = min(s, n)
+    # initialization
+    indexes = np.zeros(s, dtype=np.int64)
+    L1, L2 = np.zeros((n, s)), np.zeros((n, s))
+    # only the lower triangle of the precision is stored
+    prec = inv_lower(gram(X, kernel))
     cond_var1: np.ndarray = kernel.diag(X)  # type: ignore
     # the full conditional of i corresponds to the ith diagonal in precision
-    cond_var2 = np.sum(L2 * L2, axis=1)
+    cond_var2 = np.copy(np.diagonal(prec))
+    # number of columns of the factors computed for each candidate
+    step = np.zeros(n, dtype=np.int64)
+    # gains only decrease as points are selected so stale gains are bounds
+    heap = [(-gain, k) for k, gain in enumerate(cond_var1 * cond_var2)]
+    heapq.heapify(heap)
 
     for i in range(s):
+        # re-evaluate the best candidate until it stays on top
+        while step[heap[0][1]] < i:
+            _, k = heapq.heappop(heap)
+            # points selected since k was last evaluated
+            t = step[k]
+            new = indexes[t:i]
+            # bring row k of both factors up to date by left looking
+            cov: np.ndarray = kernel(X[new], X[k : k + 1])  # type: ignore
+            L1[k, t:i] = cov.flatten() - L1[new, :t] @ L1[k, :t]
+            L1[k, t:i] = solve_triangular(L1[new, t:i], L1[k, t:i])
+            row = np.where(new < k, prec[k, new], prec[new, k])
+            L2[k, t:i] = row - L2[new, :t] @ L2[k, :t]
+            L2[k, t:i] = solve_triangular(L2[new, t:i], L2[k, t:i])
+            # update conditional variances
+            cond_var1[k] -= np.dot(L1[k, t:i], L1[k, t:i])
+            cond_var2[k] -= np.dot(L2[k, t:i], L2[k, t:i])
+            step[k] = i
+            heapq.heappush(heap, (-cond_var1[k] * cond_var2[k], k))
         # pick best entry
-        k = np.argmax(cond_var1 * cond_var2)
+        _, k = heapq.heappop(heap)
         indexes[i] = k
-        j = np.argwhere(candidates == k).item()
-        candidates = np.delete(candidates, j)
+        # finish column i of the factors for the selected point
+        L1[k, i] = np.sqrt(cond_var1[k])
+        L2[k, i] = np.sqrt(cond_var2[k])
+
+    return indexes
+
+
+def mi_lowrank(
+    X: np.ndarray,
+    kernel: Kernel,
+    s: int,
+    rank: int = 100,
+    fixed: np.ndarray | None = None,
+    forbidden: np.ndarray | None = None,
+    nugget: float = 1e-6,
+) -> np.ndarray:
+    """Max mutual information with a low rank precision of non-selected."""
+    # O(n r^2 + (f + s)*(n*s + n*r + r^2)) for a rank r Nystrom approximation
+    from .selector import EntropySelector
+
+    n = len(X)
+    fixed = np.zeros(0, dtype=np.int64) if fixed is None else fixed
+    forbidden = np.zeros(0, dtype=np.int64) if forbidden is None else forbidden
+    f = len(fixed)
+    s = min(s, n - len(np.union1d(fixed, forbidden)))
+    rank = min(rank, n)
+    # initialization
+    indexes = np.zeros(s, dtype=np.int64)
+    L1 = np.zeros((n, f + s))
+    cond_var1: np.ndarray = kernel.diag(X)  # type: ignore
+    var = np.copy(cond_var1)
+    condition_fixed(X, kernel, L1, cond_var1, fixed)
+    # forbidden points stay in the complement but are never selected
+    cond_var1[forbidden] = -1
+    # the factor of the most entropic points is a Nystrom factor F with
+    # K ~ F F^T + D, where D is the variance conditional on the pivots
+    selector = EntropySelector(X, kernel)
+    pivots = selector.extend(rank)
+    F, R = selector.L, selector.L[pivots]
+    # pivots are interpolated exactly, so D is only kept for the rest,
+    # where a nugget keeps it invertible
+    D = np.maximum(selector.cond_var, nugget * var)
+    V = F / np.sqrt(D)[:, np.newaxis]
+    V[pivots] = 0
+    # rows of R for the pivots still in the complement, others are zero
+    U, position = np.copy(R), np.full(n, -1)
+    position[pivots] = np.arange(rank)
+    # with the r x r capacitance M = I + F_N^T D^-1 F_N of the non-pivots N,
+    # block elimination of the pivots P gives the precision blocks
+    #   Z_PP = (U M^-1 U^T)^-1, Z_NP = -D^-1 F_N M^-1 U^T Z_PP,
+    #   Z_NN = D^-1 - D^-1 F_N S F_N^T D^-1 for S = M^-1 - M^-1 U^T Z_PP U M^-1
+    # where S = 0 while every pivot is in the complement
+    M = np.identity(rank) + V.T @ V
+    M_inv = inv(M)
+    R_inv = solve_triangular(R, np.identity(rank))
+    Z = R_inv.T @ M @ R_inv
+    # the full conditional of i corresponds to the ith diagonal in precision
+    cond_var2 = 1 / D
+    cond_var2[pivots] = np.diagonal(Z)
+    complement = np.ones(n, dtype=bool)
+
+    def marginalize(k: int) -> None:
+        """Remove k from the complement, updating the precision diagonal."""
+        # column k of the precision, restricted to the complement
+        t = position[k]
+        if t >= 0:
+            z = np.copy(Z[:, t])
+            column = -(V @ (M_inv @ (U.T @ z))) / np.sqrt(D)
+        else:
+            a = M_inv @ F[k] / D[k]
+            z = -Z @ (U @ a)
+            column = -(V @ (a + M_inv @ (U.T @ z))) / np.sqrt(D)
+            column[k] += 1 / D[k]
+        column[pivots] = z
+        # marginalizing k out of the joint is a Schur complement on k
+        complement[k] = False
+        cond_var2[complement] -= column[complement] ** 2 / column[k]
+        if t >= 0:
+            # which for a pivot is a Schur complement of Z_PP on its row
+            Z[:] -= np.outer(z, z / z[t])
+            U[t] = 0
+        else:
+            # and otherwise removes v_k v_k^T from M, a rank-one update of
+            # its inverse by Sherman-Morrison and of Z_PP by Woodbury
+            u = M_inv @ V[k]
+            c = 1 - np.dot(V[k], u)
+            M_inv[:] += np.outer(u, u / c)
+            w = Z @ (U @ u)
+            Z[:] -= np.outer(w, w / (c + np.dot(U @ u, w)))
+
+    # fixed points are independent of the rest, removing them from precision
+    for k in fixed:
+        marginalize(k)
+
+    for i in range(f, f + s):
+        # pick best entry
+        k = np.argmax(cond_var1 * cond_var2)
+        indexes[i - f] = k
         # update Cholesky factor
         L1[:, i] = kernel(X, X[k : k + 1]).flatten()  # type: ignore
         L1[:, i] -= L1[:, :i] @ L1[k, :i]
@@ -264,13 +993,162 @@ def mi_chol(X: np.ndarray, kernel: Kernel, s: int) -> np.ndarray:
         # update conditional variance
         cond_var1 -= L1[:, i] ** 2
         cond_var1[k] = -1
-        # update Cholesky factor of precision of candidates
+        # update conditional variance of the complement
+        marginalize(k)
+
+    return indexes
+
+
+# local kernels, section 6.1 in the Krause paper
+
+
+def mi_local(
+    X: np.ndarray,
+    kernel: Kernel,
+    s: int,
+    n_neighbors: int = 32,
+    radius: float = np.inf,
+) -> np.ndarray:
+    """Max mutual information with non-selected points in a neighborhood."""
+    # O(n*m^3 + s*(n*s + r*m^3)) for m neighbors, r points per neighborhood
+    n = len(X)
+    s = min(s, n)
+    # initialization
+    indexes, candidates = np.zeros(s, dtype=np.int64), np.ones(n, dtype=bool)
+    L = np.zeros((n, s))
+    cond_var1: np.ndarray = kernel.diag(X)  # type: ignore
+    # nearest neighbors within the cutoff radius, excluding the point itself
+    _, nearest = scipy.spatial.KDTree(X).query(
+        X, k=min(n_neighbors + 1, n), distance_upper_bound=radius
+    )
+    neighbors = [
+        nbrs[(nbrs != i) & (nbrs < n)][:n_neighbors]
+        for i, nbrs in enumerate(nearest.reshape(n, -1))
+    ]
+    # points whose neighborhood contains a given point
+    sizes = np.array(list(map(len, neighbors)), dtype=np.int64)
+    adjacency = scipy.sparse.csr_array(
+        (
+            np.ones(np.sum(sizes), dtype=bool),
+            np.concatenate(neighbors, dtype=np.int64),
+            np.concatenate(([0], np.cumsum(sizes))),
+        ),
+        shape=(n, n),
+    ).T.tocsr()
+    # condition on neighbors instead of all other candidates
+    cond_var2 = np.array(
+        [local_prec(X, kernel, i, nbrs) for i, nbrs in enumerate(neighbors)]
+    )
+
+    for i in range(s):
+        # pick best entry
+        k = np.argmax(cond_var1 * cond_var2)
+        indexes[i] = k
+        candidates[k] = False
+        # update Cholesky factor
+        L[:, i] = kernel(X, X[k : k + 1]).flatten()  # type: ignore
+        L[:, i] -= L[:, :i] @ L[k, :i]
+        L[:, i] /= np.sqrt(L[k, i])
+        # update conditional variance
+        cond_var1 -= L[:, i] ** 2
+        cond_var1[k] = -1
+        # remove from the neighborhoods containing it
+        start, end = adjacency.indptr[k : k + 2]
+        for j in adjacency.indices[start:end]:
+            neighbors[j] = neighbors[j][neighbors[j] != k]
+            if candidates[j]:
+                cond_var2[j] = local_prec(X, kernel, j, neighbors[j])
+
+    return indexes
+
+
+# compactly supported kernels, columns of the factor are mostly zero
+
+
+def entropy_sparse(X: np.ndarray, kernel: Kernel, s: int) -> np.ndarray:
+    """Returns a list of the most entropic points in X greedily and sparsely."""
+    # O(s*(m c + m log n)) for m nonzeros per column, c columns per row
+    from .kernels import support
+
+    n = len(X)
+    s = min(s, n)
+    radius = support(kernel)
+    if not np.isfinite(radius):
+        raise ValueError(f"{kernel} isn't compactly supported")
+    # initialization
+    indexes, selected = np.zeros(s, dtype=np.int64), np.zeros(n, dtype=bool)
+    tree = scipy.spatial.KDTree(X)
+    # columns of the factor compressed to their rows and values, and the
+    # columns with a nonzero in each row
+    L: list[tuple[np.ndarray, np.ndarray]] = []
+    touching: dict[int, list[int]] = {}
+    cond_var: np.ndarray = kernel.diag(X)  # type: ignore
+    # variances only decrease, so entries older than a point's are skipped
+    heap = [(-var, k) for k, var in enumerate(cond_var.tolist())]
+    heapq.heapify(heap)
+
+    for i in range(s):
+        # pick best entry
+        while selected[heap[0][1]] or -heap[0][0] != cond_var[heap[0][1]]:
+            heapq.heappop(heap)
+        _, k = heapq.heappop(heap)
+        indexes[i] = k
+        selected[k] = True
+        # update Cholesky factor and conditional variance on the support
+        rows = sparse_column(X, kernel, tree, radius, L, touching, cond_var, k)
+        for j, var in zip(rows.tolist(), cond_var[rows].tolist()):
+            if not selected[j]:
+                heapq.heappush(heap, (-var, j))
+
+    return indexes
+
+
+def mi_sparse(X: np.ndarray, kernel: Kernel, s: int) -> np.ndarray:
+    """Max mutual information between selected and non-selected sparsely."""
+    # O(f + s*(m c + g + n*s)) for g nonzeros in the sparse factor of the
+    # covariance and f = O(sum of squared column counts) to invert it
+    from .kernels import support
+
+    n = len(X)
+    s = min(s, n)
+    radius = support(kernel)
+    if not np.isfinite(radius):
+        raise ValueError(f"{kernel} isn't compactly supported")
+    # initialization
+    indexes, candidates = np.zeros(s, dtype=np.int64), np.ones(n, dtype=bool)
+    tree = scipy.spatial.KDTree(X)
+    L1: list[tuple[np.ndarray, np.ndarray]] = []
+    touching: dict[int, list[int]] = {}
+    cond_var1: np.ndarray = kernel.diag(X)  # type: ignore
+    # sparse Cholesky factor of the covariance, symmetric pivoting on a
+    # fill-reducing ordering makes the LU factorization L D L^T
+    lu = scipy.sparse.linalg.splu(
+        sparse_gram(X, kernel, tree, radius),
+        permc_spec="MMD_AT_PLUS_A",
+        diag_pivot_thresh=0,
+        options={"SymmetricMode": True},
+    )
+    # the precision is dense, but its diagonal isn't
+    cond_var2 = inv_diag(lu)
+    # columns of the precision conditioned on the previous selections
+    L2 = np.zeros((n, s))
+    e = np.zeros(n)
+
+    for i in range(s):
+        # pick best entry
+        k = np.argmax(cond_var1 * cond_var2)
+        indexes[i] = k
+        candidates[k] = False
+        # update Cholesky factor and conditional variance on the support
+        sparse_column(X, kernel, tree, radius, L1, touching, cond_var1, k)
+        # column k of the precision by a sparse solve
         # marginalization in covariance is conditioning in precision
-        u = L2 @ L2[j]
-        u /= np.sqrt(u[j])
-        L2 = chol_downdate(L2, u, j)
-        L2 = np.delete(np.delete(L2, j, 0), j, 1)
+        e[k] = 1
+        L2[:, i] = lu.solve(e)
+        e[k] = 0
+        L2[:, i] -= L2[:, :i] @ L2[k, :i]
+        L2[:, i] /= np.sqrt(L2[k, i])
         # update conditional variance of candidates
-        cond_var2[candidates] = np.sum(L2 * L2, axis=1)
+        cond_var2[candidates] -= L2[candidates, i] ** 2
 
     return indexes
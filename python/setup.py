@@ -1,3 +1,5 @@
+import os
+
 import numpy as np
 from Cython.Build import cythonize
 from setuptools import Extension, setup
@@ -21,6 +23,8 @@ extensions = [
         include_dirs=[np.get_include()],
         define_macros=[("NPY_NO_DEPRECATED_API", "NPY_1_7_API_VERSION")],
         libraries=libraries,
+        # OpenMP runtime is provided by iomp5
+        extra_compile_args=["-fopenmp"],
         # extra_compile_args=["-Ofast", "-ffast-math"],
     ),
 ]
@@ -35,6 +39,8 @@ setup(
             "wraparound": False,
             "initializedcheck": False,
             "cdivision": True,
+            # hooks for cProfile, off by default as they slow down cdef calls
+            "profile": os.environ.get("CYSENSOR_PROFILE") == "1",
         },
     ),
 )